@@ -0,0 +1,392 @@
+"""
+This module seeds a local database with fake users, parties and characters, drives the webserver routes
+through the Flask test client and reports latency percentiles and database round trips per request.
+
+Point the .env at a scratch database before running it; seeding deletes and recreates every row whose
+username starts with bench_ and every party whose name starts with "bench ".
+"""
+import sys
+import os
+import math
+import json
+import time
+import random
+import argparse
+import subprocess
+from datetime import datetime, timezone
+
+BENCH_PATH = os.path.dirname(os.path.abspath(__file__))
+REPO_PATH = os.path.dirname(BENCH_PATH)
+sys.path.insert(0, os.path.join(REPO_PATH, 'webserver'))
+
+import dbutilities
+import storage
+from rules import get_rules
+from derivedstats import to_mask
+
+USER_PREFIX = 'bench_'
+PARTY_PREFIX = 'bench '
+# Benchmark users never log in, the test client session is set directly
+BENCH_PASSWORD_HASH = 'benchmark-user-cannot-log-in'
+
+
+class CountingCursor:
+    """
+    Cursor proxy that counts the statements it runs
+    """
+    __slots__ = ('_cursor', '_counts')
+
+    def __init__(self, cursor, counts):
+        self._cursor = cursor
+        self._counts = counts
+
+    def execute(self, *args, **kwargs):
+        self._counts['queries'] += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._counts['queries'] += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class CountingConnection:
+    """
+    Connection proxy that hands out CountingCursors
+    """
+    __slots__ = ('_conn', '_counts')
+
+    def __init__(self, conn, counts):
+        self._conn = conn
+        self._counts = counts
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._counts)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._conn.__exit__(*exc_info)
+
+
+def count_database_calls(counts):
+    """
+    Makes every dbutilities helper report its connections and statements into counts
+    """
+    borrow = dbutilities.initialize_connection
+
+    def counting_initialize_connection():
+        counts['connections'] += 1
+        return CountingConnection(borrow(), counts)
+
+    dbutilities.initialize_connection = counting_initialize_connection
+
+
+def clear_seed_data(cursor):
+    """
+    Deletes everything a previous seed created
+    """
+    like_user = USER_PREFIX.replace('_', '!_') + '%'
+    cursor.execute("DELETE FROM Characters WHERE username LIKE %s ESCAPE '!';", (like_user,))
+    cursor.execute("DELETE FROM Users WHERE username LIKE %s ESCAPE '!';", (like_user,))
+    cursor.execute("DELETE FROM Party WHERE Name LIKE %s;", (PARTY_PREFIX + '%',))
+
+
+def create_in_memory_database():
+    """
+    Points dbutilities at a new in-memory SQLite database holding the schema and reference data,
+    so the benchmark runs without a database server
+    """
+    storage.set_backend(storage.SQLiteBackend(':memory:'))
+    sys.path.insert(0, os.path.join(REPO_PATH, 'scripts'))
+    from dataimport import iter_entries, import_entries
+
+    with dbutilities.initialize_connection() as conn:
+        with open(os.path.join(REPO_PATH, 'scripts', 'database-setup.sql'), encoding="utf-8") as file:
+            storage.run_script(conn, file.read())
+        with open(os.path.join(REPO_PATH, 'data', 'initial-data.json'), encoding="utf-8") as file:
+            import_entries(conn, iter_entries(file), 1000)
+
+
+def seed(users, characters_per_user, parties, seed_value):
+    """
+    Fills the database with benchmark users, parties and characters
+
+    Returns:
+        dict: usernames, character IDs per user and party IDs that were created
+    """
+    rng = random.Random(seed_value)
+    rules = get_rules()
+    races = [row[2] for row in dbutilities.get_table_contents('Race')]
+    classes = [row[2] for row in dbutilities.get_table_contents('Class')]
+    backgrounds = [row[2] for row in dbutilities.get_table_contents('Background')]
+    if not races or not classes or not backgrounds:
+        raise SystemExit("Import the reference data with scripts/dataimport.py before seeding")
+
+    with dbutilities.initialize_connection() as conn:
+        cursor = conn.cursor()
+        clear_seed_data(cursor)
+        cursor.executemany("INSERT INTO Party (Name) VALUES (%s);", [(f"{PARTY_PREFIX}{index:05d}",) for index in range(parties)])
+        cursor.execute("SELECT ID FROM Party WHERE Name LIKE %s ORDER BY ID;", (PARTY_PREFIX + '%',))
+        party_ids = [row[0] for row in cursor.fetchall()]
+        usernames = [f"{USER_PREFIX}{index:05d}" for index in range(users)]
+        cursor.executemany(
+            "INSERT INTO Users (username, password, ID) VALUES (%s, %s, %s);",
+            [(username, BENCH_PASSWORD_HASH, party_ids[index % len(party_ids)] if party_ids else None) for index, username in enumerate(usernames)]
+        )
+        conn.commit()
+
+    character_ids = {}
+    for username in usernames:
+        character_ids[username] = []
+        for index in range(characters_per_user):
+            scores = [rng.randint(3, 18) for _ in rules.abilities]
+            bonus = rng.randint(2, 6)
+            throws = to_mask([ability for ability in rules.abilities if rng.random() < 0.3], rules.ability_index)
+            skills = to_mask([skill for skill in rules.skills if rng.random() < 0.3], rules.skill_index)
+            expertise = to_mask([skill for skill in rules.skills if rng.random() < 0.05], rules.skill_index) & skills
+            character_id = dbutilities.add_character_with_details(
+                f"Bench Hero {index}", rng.choice(races), rng.choice(classes), rng.choice(backgrounds),
+                scores, bonus, username, throws, skills, expertise
+            )
+            character_ids[username].append(character_id)
+    return {'usernames': usernames, 'character_ids': character_ids, 'party_ids': party_ids, 'races': races, 'classes': classes, 'backgrounds': backgrounds}
+
+
+def load_seed():
+    """
+    Reads back the benchmark rows an earlier seed left in the database
+
+    Returns:
+        dict: same shape as seed() returns
+    """
+    with dbutilities.initialize_connection() as conn:
+        cursor = conn.cursor()
+        like_user = USER_PREFIX.replace('_', '!_') + '%'
+        cursor.execute("SELECT username, ID FROM Characters WHERE username LIKE %s ESCAPE '!' ORDER BY username, ID;", (like_user,))
+        character_ids = {}
+        for username, character_id in cursor.fetchall():
+            character_ids.setdefault(username, []).append(character_id)
+        cursor.execute("SELECT ID FROM Party WHERE Name LIKE %s ORDER BY ID;", (PARTY_PREFIX + '%',))
+        party_ids = [row[0] for row in cursor.fetchall()]
+    if not character_ids:
+        raise SystemExit("No benchmark data found, run without --no-seed first")
+    return {
+        'usernames': sorted(character_ids),
+        'character_ids': character_ids,
+        'party_ids': party_ids,
+        'races': [row[2] for row in dbutilities.get_table_contents('Race')],
+        'classes': [row[2] for row in dbutilities.get_table_contents('Class')],
+        'backgrounds': [row[2] for row in dbutilities.get_table_contents('Background')],
+    }
+
+
+def create_form(rng, seeded):
+    """
+    Builds a POST body for /characters/create
+    """
+    rules = get_rules()
+    form = {
+        'name': f"Bench Created {rng.randint(0, 10**6)}",
+        'race': str(rng.choice(seeded['races'])),
+        'class': str(rng.choice(seeded['classes'])),
+        'background': str(rng.choice(seeded['backgrounds'])),
+        'proficiency-bonus': str(rng.randint(2, 6)),
+    }
+    for ability in rules.abilities:
+        form[ability] = str(rng.randint(3, 18))
+        if rng.random() < 0.3:
+            form[f"{ability}-proficiency"] = 'true'
+    for skill in rules.skills:
+        if rng.random() < 0.3:
+            form[f"{skill}-proficiency"] = 'true'
+    return form
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_routes(app, seeded, requests_per_route, warmup, seed_value, counts):
+    """
+    Drives each route through the Flask test client
+
+    Returns:
+        dict: route name to latency and database statistics
+    """
+    rng = random.Random(seed_value)
+    username = seeded['usernames'][0]
+    own_characters = seeded['character_ids'][username]
+
+    routes = {
+        'GET /characters': lambda: ('GET', '/characters', None),
+        'GET /characters/show/<id>': lambda: ('GET', f"/characters/show/{rng.choice(own_characters)}", None),
+        'GET /characters/create': lambda: ('GET', '/characters/create', None),
+        'POST /characters/create': lambda: ('POST', '/characters/create', create_form(rng, seeded)),
+        'GET /party': lambda: ('GET', '/party', None),
+        'GET /party/join': lambda: ('GET', '/party/join', None),
+        'GET /party/roster': lambda: ('GET', '/party/roster', None),
+        'GET /reference': lambda: ('GET', '/reference', None),
+        'GET /reference/races': lambda: ('GET', '/reference/races', None),
+        'GET /reference/classes': lambda: ('GET', '/reference/classes', None),
+        'GET /reference/backgrounds': lambda: ('GET', '/reference/backgrounds', None),
+        'GET /api/v1/characters?ids=': lambda: ('GET', f"/api/v1/characters?ids={','.join(map(str, own_characters))}", None),
+        'GET /api/v1/party': lambda: ('GET', '/api/v1/party', None),
+        'GET /api/v1/reference': lambda: ('GET', '/api/v1/reference', None),
+    }
+
+    results = {}
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['authenticated'] = True
+        session['username'] = username
+
+    for name, make_request in routes.items():
+        timings = []
+        queries = 0
+        connections = 0
+        for iteration in range(warmup + requests_per_route):
+            method, path, form = make_request()
+            counts['queries'] = counts['connections'] = 0
+            start = time.perf_counter()
+            response = client.open(path, method=method, data=form)
+            elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                raise SystemExit(f"{name} answered {response.status_code}")
+            if iteration >= warmup:
+                timings.append(elapsed * 1000)
+                queries += counts['queries']
+                connections += counts['connections']
+        timings.sort()
+        results[name] = {
+            'requests': requests_per_route,
+            'mean_ms': sum(timings) / len(timings),
+            'p50_ms': percentile(timings, 0.50),
+            'p90_ms': percentile(timings, 0.90),
+            'p99_ms': percentile(timings, 0.99),
+            'max_ms': timings[-1],
+            'db_queries_per_request': queries / requests_per_route,
+            'db_connections_per_request': connections / requests_per_route,
+        }
+    return results
+
+
+def git_revision():
+    """
+    Gets the commit being benchmarked, if this is a git checkout
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_PATH, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline_path, results, threshold):
+    """
+    Prints how results moved against a saved baseline
+
+    Returns:
+        bool: True if some route got slower than threshold percent at p50 or p99, or needs more queries
+    """
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)['routes']
+    regressed = False
+    print(f"\n{'route':32} {'p50 ms':>18} {'p99 ms':>18} {'queries':>14}")
+    for name, current in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"{name:32} {'new':>18}")
+            continue
+        cells = []
+        for key in ('p50_ms', 'p99_ms'):
+            change = (current[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            regressed |= change > threshold
+            cells.append(f"{current[key]:8.2f} ({change:+5.0f}%)")
+        regressed |= current['db_queries_per_request'] > old['db_queries_per_request']
+        cells.append(f"{old['db_queries_per_request']:5.1f} -> {current['db_queries_per_request']:5.1f}")
+        print(f"{name:32} {cells[0]:>18} {cells[1]:>18} {cells[2]:>14}")
+    return regressed
+
+
+def main():
+    """
+    Main function for module
+
+    Returns:
+        int: 0 for success, 1 if --compare found a regression
+    """
+    parser = argparse.ArgumentParser(description="Benchmark webserver routes against a local database")
+    parser.add_argument('--users', type=int, default=50, help="Benchmark users to seed")
+    parser.add_argument('--characters', type=int, default=20, help="Characters seeded per user")
+    parser.add_argument('--parties', type=int, default=200, help="Parties to seed")
+    parser.add_argument('--no-seed', action='store_true', help="Reuse data from an earlier seed")
+    parser.add_argument('--in-memory', action='store_true', help="Run against a throwaway in-memory SQLite database instead of the one in .env")
+    parser.add_argument('--requests', type=int, default=200, help="Timed requests per route")
+    parser.add_argument('--warmup', type=int, default=10, help="Untimed requests per route before timing")
+    parser.add_argument('--seed', type=int, default=350, help="Random seed for generated data and requests")
+    parser.add_argument('--output', help="Where to write the JSON results, default benchmarks/results/<time>-<commit>.json")
+    parser.add_argument('--compare', help="Baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=10.0, help="Percent slowdown --compare treats as a regression")
+    args = parser.parse_args()
+    if args.in_memory and args.no_seed:
+        parser.error("--no-seed needs a database that outlives the benchmark")
+
+    if args.in_memory:
+        create_in_memory_database()
+    if args.no_seed:
+        seeded = load_seed()
+    else:
+        start = time.perf_counter()
+        seeded = seed(args.users, args.characters, args.parties, args.seed)
+        print(f"Seeded {args.users} users, {args.users * args.characters} characters and {args.parties} parties in {time.perf_counter() - start:.1f} seconds")
+
+    counts = {'queries': 0, 'connections': 0}
+    count_database_calls(counts)
+    from main import app
+    app.config['TESTING'] = True
+    results = run_routes(app, seeded, args.requests, args.warmup, args.seed, counts)
+
+    for name, result in results.items():
+        print(f"{name:32} p50 {result['p50_ms']:7.2f} ms  p90 {result['p90_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms  "
+              f"{result['db_queries_per_request']:5.1f} queries  {result['db_connections_per_request']:4.1f} connections")
+
+    revision = git_revision()
+    output = args.output or os.path.join(BENCH_PATH, 'results', f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{revision or 'unknown'}.json")
+    with open(output, 'w', encoding="utf-8") as file:
+        json.dump({
+            'meta': {
+                'revision': revision,
+                'created': datetime.now(timezone.utc).isoformat(),
+                'users': len(seeded['usernames']),
+                'characters_per_user': len(seeded['character_ids'][seeded['usernames'][0]]),
+                'parties': len(seeded['party_ids']),
+                'requests_per_route': args.requests,
+                'backend': storage.get_backend().name,
+            },
+            'routes': results,
+        }, file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare and compare(args.compare, results, args.threshold):
+        print("Regression against baseline")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
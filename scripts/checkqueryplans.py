@@ -0,0 +1,187 @@
+"""
+This module runs EXPLAIN on every query in webserver/dbutilities.py and fails if any of them
+scans a whole large table. Run it against a database holding realistic amounts of data,
+since the optimizer happily scans tables with only a handful of rows.
+"""
+import sys
+import os
+import re
+import ast
+from dataimport import initialize_connection
+from storage import get_backend, DatabaseError
+
+SCRIPT_PATH = __file__
+DBUTILITIES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(SCRIPT_PATH))), 'webserver', 'dbutilities.py')
+
+# Tables that grow with the number of users. Reference tables are tiny and served from cache.
+LARGE_TABLES = {'Users', 'Party', 'Characters'}
+# EXPLAIN access types that read every row of a table or index
+FULL_SCAN_TYPES = {'ALL', 'index'}
+
+def _literal(node, names=None):
+    """
+    Evaluates a node if it is a plain literal, a name bound to a string or strings joined with +,
+    otherwise None
+    """
+    if isinstance(node, ast.Name):
+        return (names or {}).get(node.id)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left = _literal(node.left, names)
+        right = _literal(node.right, names)
+        if isinstance(left, str) and isinstance(right, str):
+            return left + right
+        return None
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError):
+        return None
+
+def find_queries(path=DBUTILITIES_PATH):
+    """
+    Collects the SQL of every query in dbutilities
+    Picks up strings assigned to query, and rebuilds keyset paginated queries from
+    their _fetch_page() arguments, with and without the conditions appended to them,
+    paging both forwards (after) and backwards (before). Strings may be joined with +
+    from module level constants. Queries built from f-strings are skipped; they only
+    run against the small reference tables.
+
+    Returns:
+        list: tuples of (function name, sql)
+    """
+    with open(path, encoding="utf-8") as file:
+        tree = ast.parse(file.read())
+
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            value = _literal(node.value, constants)
+            if isinstance(value, str):
+                constants[node.targets[0].id] = value
+
+    queries = []
+    for function in tree.body:
+        if not isinstance(function, ast.FunctionDef):
+            continue
+        literals = dict(constants)
+        optional = _appended_conditions(function)
+        for node in ast.walk(function):
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                value = _literal(node.value, literals)
+                if isinstance(value, str):
+                    literals[node.targets[0].id] = value
+                    if node.targets[0].id == 'query':
+                        queries.append((function.name, value))
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == '_fetch_page':
+                args = node.args
+                select = _literal(args[1], literals)
+                conditions = _literal(args[2]) or []
+                key_column = _literal(args[4])
+                if select is None or key_column is None:
+                    continue
+                # Check the query without its optional filters and with all of them, e.g. the
+                # name prefix filter of get_parties
+                variants = [list(conditions)]
+                if isinstance(args[2], ast.Name) and optional.get(args[2].id):
+                    variants.append(list(conditions) + optional[args[2].id])
+                for variant in variants:
+                    for comparison, order in ((">", "ASC"), ("<", "DESC")):
+                        where = ' AND '.join(variant + [f"{key_column} {comparison} %s"])
+                        queries.append((function.name, f"{select} WHERE {where} ORDER BY {key_column} {order} LIMIT %s"))
+    return queries
+
+def _appended_conditions(function):
+    """
+    Finds the string literals a function appends to its lists, which is how optional filters
+    are added to the conditions passed to _fetch_page()
+
+    Returns:
+        dict: list variable name to the conditions appended to it
+    """
+    appended = {}
+    for node in ast.walk(function):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'append'
+                and isinstance(node.func.value, ast.Name) and len(node.args) == 1):
+            value = _literal(node.args[0])
+            if isinstance(value, str):
+                appended.setdefault(node.func.value.id, []).append(value)
+    return appended
+
+def explainable(sql):
+    """
+    Turns a parameterized query into one EXPLAIN can run, or None for statements not worth explaining
+    """
+    sql = sql.strip().rstrip(';')
+    if not re.match(r'(?is)^\s*(SELECT|UPDATE|DELETE)\b', sql):
+        return None
+    # LIMIT needs a number. Everything else gets a quoted string so string columns still use their indexes
+    sql = re.sub(r'(?i)LIMIT\s+%s', 'LIMIT 1', sql)
+    return "EXPLAIN " + sql.replace('%s', "'1'")
+
+def full_scans(cursor, sql):
+    """
+    Runs EXPLAIN and returns the large tables it reads in full
+
+    Returns:
+        list: tuples of (table, access type)
+    """
+    cursor.execute(sql)
+    columns = [column[0] for column in cursor.description]
+    scans = []
+    for row in cursor.fetchall():
+        plan = dict(zip(columns, row))
+        if plan.get('type') not in FULL_SCAN_TYPES:
+            continue
+        # Aliased tables show up under their alias in the plan
+        table = plan.get('table')
+        table = table if table in LARGE_TABLES else _aliased_table(sql, table)
+        if table in LARGE_TABLES:
+            scans.append((table, plan['type']))
+    return scans
+
+def _aliased_table(sql, alias):
+    """
+    Finds the table an alias in a query stands for
+    """
+    if not alias:
+        return None
+    match = re.search(rf'(?i)\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?{re.escape(alias)}\b', sql)
+    return match.group(1) if match else None
+
+def main():
+    """
+    Main function for module
+
+    Returns:
+        int: 0 if no query scans a large table, 1 otherwise
+    """
+    if get_backend().name != 'mariadb':
+        print("Query plans are only checked on MariaDB, set dbbackend=mariadb")
+        return 1
+    conn = initialize_connection()
+    cursor = conn.cursor()
+    failures = 0
+    checked = 0
+    try:
+        for function_name, sql in find_queries():
+            statement = explainable(sql)
+            if statement is None:
+                continue
+            checked += 1
+            scans = full_scans(cursor, statement)
+            if scans:
+                failures += 1
+                tables = ', '.join(f"{table} ({access})" for table, access in scans)
+                print(f"FULL SCAN in {function_name}: {tables}")
+                print(f"    {' '.join(sql.split())}")
+    except DatabaseError as e:
+        print(f"Could not explain queries: {e}")
+        return 1
+    finally:
+        conn.rollback()
+        conn.close()
+
+    print(f"Checked {checked} queries, {failures} with full table scans")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,8 @@ CREATE TABLE Party
 (
   ID SERIAL,
   Name VARCHAR(50) NOT NULL,
-  PRIMARY KEY (ID)
+  PRIMARY KEY (ID),
+  INDEX Party_Name (Name)
 );
 CREATE TABLE Race
 (
@@ -35,6 +36,7 @@ CREATE TABLE Users
   totpseed VARCHAR(40),
   ID BIGINT UNSIGNED,
   PRIMARY KEY (username),
+  INDEX Users_Party (ID, username),
   FOREIGN KEY (ID) REFERENCES Party(ID)
 );
 CREATE TABLE Characters
@@ -52,41 +54,44 @@ CREATE TABLE Characters
   BackgroundID BIGINT UNSIGNED NULL,
   RaceID BIGINT UNSIGNED NOT NULL,
   ClassID BIGINT UNSIGNED NOT NULL,
+  Saving_Throw_Proficiencies INT NOT NULL DEFAULT 0,
+  Skill_Proficiencies INT NOT NULL DEFAULT 0,
+  Skill_Expertise INT NOT NULL DEFAULT 0,
   PRIMARY KEY (ID),
+  INDEX Characters_User_ID (username, ID),
   FOREIGN KEY (username) REFERENCES Users(username),
   FOREIGN KEY (BackgroundID) REFERENCES Background(BackgroundID),
   FOREIGN KEY (RaceID) REFERENCES Race(RaceID),
   FOREIGN KEY (ClassID) REFERENCES Class(ClassID)
 );
-CREATE TABLE Skills
-(
-  SkillName VARCHAR(50) NOT NULL,
-  Modifier INT NOT NULL,
-  Proficiency BOOL NOT NULL,
-  ID BIGINT UNSIGNED NOT NULL,
-  PRIMARY KEY (SkillName, ID),
-  FOREIGN KEY (ID) REFERENCES Characters(ID) ON DELETE CASCADE
-);
-CREATE TABLE Saving_Throws
+CREATE TABLE Reference_Version
 (
-  Saving_ThrowName VARCHAR(50) NOT NULL,
-  Modifier INT NOT NULL,
-  Proficiency BOOL NOT NULL,
-  ID BIGINT UNSIGNED NOT NULL,
-  PRIMARY KEY (Saving_ThrowName, ID),
-  FOREIGN KEY (ID) REFERENCES Characters(ID) ON DELETE CASCADE
+  ID INT NOT NULL,
+  Version BIGINT UNSIGNED NOT NULL,
+  PRIMARY KEY (ID)
 );
-CREATE VIEW CharacterDetails AS
+CREATE OR REPLACE VIEW CharacterDetails AS
 SELECT
     c.*,
     r.RaceName, r.Page_Number AS Race_Page_Number,
     b.BackgroundName, b.Page_Number AS Background_Page_Number,
-    cl.ClassName, cl.Page_Number AS Class_Page_Number,
-    s.SkillName, s.Modifier AS Skill_Modifier, s.Proficiency AS Skill_Proficiency,
-    st.Saving_ThrowName, st.Modifier AS Saving_Throw_Modifier, st.Proficiency AS Saving_Throw_Proficiency
+    cl.ClassName, cl.Page_Number AS Class_Page_Number
 FROM Characters c
 JOIN Race r ON c.RaceID = r.RaceID
-JOIN Background b ON c.BackgroundID = b.BackgroundID
-JOIN Class cl ON c.ClassID = cl.ClassID
-JOIN Skills s ON c.ID = s.ID
-JOIN Saving_Throws st ON c.ID = st.ID;
+LEFT JOIN Background b ON c.BackgroundID = b.BackgroundID
+JOIN Class cl ON c.ClassID = cl.ClassID;
+CREATE TABLE IF NOT EXISTS Schema_Migrations
+(
+  Version INT NOT NULL,
+  Name VARCHAR(255) NOT NULL,
+  Applied_At TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (Version)
+);
+INSERT INTO Schema_Migrations (Version, Name) VALUES
+  (1, 'reference_version'),
+  (2, 'character_details_view'),
+  (3, 'party_name_index'),
+  (4, 'users_party_index'),
+  (5, 'characters_user_name_index'),
+  (6, 'proficiency_bitmasks'),
+  (7, 'characters_user_id_index');
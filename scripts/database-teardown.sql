@@ -1,9 +1,11 @@
-DROP table Saving_Throws;
-DROP table Skills;
+DROP table IF EXISTS Saving_Throws;
+DROP table IF EXISTS Skills;
 DROP table Characters;
 DROP table Users;
 DROP table Party;
 DROP table Race;
 DROP table Class;
 DROP table Background;
+DROP table Reference_Version;
+DROP table IF EXISTS Schema_Migrations;
 DROP view CharacterDetails;
@@ -3,73 +3,209 @@ This module takes in json objects and uses them to populate the setup database w
 """
 import sys
 import os
+import re
 import json
+import time
+import argparse
 from dotenv import load_dotenv
-import mariadb
 
-# Database connection variables
+SCRIPT_PATH = __file__
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(SCRIPT_PATH))), 'webserver'))
+
+from storage import get_backend, DatabaseError
+
+# Database connection settings, including which backend to use
 load_dotenv()
-dbuser = os.getenv('dbuser')
-dbpassword = os.getenv('dbpassword')
-dbhost = os.getenv('dbhost')
-dbport = os.getenv('dbport')
-dbname = os.getenv('dbname')
 
-SCRIPT_PATH = __file__
+REFERENCE_TABLES = ('Race', 'Class', 'Background')
 
 def initialize_connection():
     """
-    Initializes connection to database
+    Initializes connection to the database backend configured in .env
 
     Returns:
-        mariadb.connections.Connection: Object for interacting with the database
+        Connection: Object for interacting with the database
     """
-    print("Attempting to connect to database...")
+    backend = get_backend()
+    print(f"Attempting to connect to database ({backend.describe()})...")
     try:
-        connection = mariadb.connect(
-            user=dbuser,
-            password=dbpassword,
-            host=dbhost,
-            port=int(dbport),
-            database=dbname
-        )
-    except mariadb.Error as e:
-        print(f"Error connecting to MariaDB Platform: {e}")
+        connection = backend.connect()
+    except DatabaseError as e:
+        print(f"Error connecting to the database: {e}")
         sys.exit(1)
     print('connection created successfully')
     return connection
 
-def main():
+# Characters that can follow a number in JSON
+NUMBER_END = re.compile(r'[\s,\]}:]')
+
+class JSONStream:
     """
-    Main function for module
+    Reads a JSON document from a file a chunk at a time
+    Only understands as much JSON as the import file needs: objects, strings and numbers
+    """
+    def __init__(self, file, chunk_size=65536):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """
+        Reads the next chunk, dropping what was already consumed
+
+        Returns:
+            bool: False once the file is exhausted
+        """
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character without consuming it
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in ' \t\r\n':
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON file")
+
+    def expect(self, character):
+        """
+        Consumes the next character, which has to be the given one
+        """
+        found = self.peek()
+        if found != character:
+            raise ValueError(f"Expected {character!r} in JSON file but found {found!r}")
+        self.position += 1
+
+    def value(self):
+        """
+        Decodes the next string or number
+        """
+        if self.peek() != '"':
+            # A number cut off at the end of a chunk decodes as its prefix, e.g. 1.5e3 as 1, so
+            # read on until something that ends it is buffered
+            while not NUMBER_END.search(self.buffer, self.position) and self._fill():
+                pass
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            self.position = end
+            return value
+
+    def members(self):
+        """
+        Consumes an object, yielding its keys. The caller consumes each value.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.position += 1
+                continue
+            self.expect('}')
+            return
+
+def iter_entries(file):
+    """
+    Streams (table name, entry name, page number) from the import file without loading it whole
+    """
+    stream = JSONStream(file)
+    for table_name in stream.members():
+        if table_name not in REFERENCE_TABLES:
+            raise ValueError(f"Unknown reference table in import file: {table_name}")
+        for name in stream.members():
+            yield table_name, name, stream.value()
+
+def import_entries(conn, entries, batch_size):
+    """
+    Upserts entries in executemany batches inside one transaction
 
     Returns:
-        int: 0 for success, error codes if any
+        dict: number of entries imported per table
     """
-    conn = initialize_connection()
     cursor = conn.cursor()
+    queries = {
+        table_name: f"INSERT INTO {table_name} ({table_name}Name, Page_Number) VALUES (%s, %s) ON DUPLICATE KEY UPDATE Page_Number = VALUES(Page_Number);"
+        for table_name in REFERENCE_TABLES
+    }
+    counts = {table_name: 0 for table_name in REFERENCE_TABLES}
+    batches = {table_name: [] for table_name in REFERENCE_TABLES}
+
+    try:
+        for table_name, name, page_number in entries:
+            batch = batches[table_name]
+            batch.append((name, page_number))
+            if len(batch) >= batch_size:
+                cursor.executemany(queries[table_name], batch)
+                counts[table_name] += len(batch)
+                batch.clear()
+        for table_name, batch in batches.items():
+            if batch:
+                cursor.executemany(queries[table_name], batch)
+                counts[table_name] += len(batch)
 
-    cursor.execute("show tables;")
-    query_results = cursor.fetchall()
+        # Let running webservers know their cached reference data is stale
+        cursor.execute("INSERT INTO Reference_Version (ID, Version) VALUES (1, 1) ON DUPLICATE KEY UPDATE Version = Version + 1;")
+        conn.commit()
+    except (*DatabaseError, ValueError):
+        conn.rollback()
+        raise
+    return counts
 
-    table_names = []
-    for item in query_results:
-        table_names.append(item[0])
+def main():
+    """
+    Main function for module
 
+    Returns:
+        int: 0 for success, error codes if any
+    """
     data_path = os.path.dirname(SCRIPT_PATH)
     data_path = os.path.dirname(data_path)
     data_path = os.path.join(data_path, 'data', 'initial-data.json')
-    with open(data_path, encoding="utf-8") as file:
-        loaded_json = json.load(file)
 
-    for table_name, json_object in loaded_json.items():
-        for name, page_number in json_object.items():
-            sql_insert = f"insert into {table_name} ({table_name}Name, Page_Number) values('{name}', {page_number});"
-            print(sql_insert)
-            cursor.execute(sql_insert)
-            conn.commit()
+    parser = argparse.ArgumentParser(description="Import races, classes and backgrounds into the database")
+    parser.add_argument('file', nargs='?', default=data_path, help="JSON file to import")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Rows sent per executemany call")
+    args = parser.parse_args()
 
+    conn = initialize_connection()
+    start = time.perf_counter()
+    try:
+        with open(args.file, encoding="utf-8") as file:
+            counts = import_entries(conn, iter_entries(file), args.batch_size)
+    except (*DatabaseError, ValueError) as e:
+        print(f"Import failed, nothing was written: {e}")
+        conn.close()
+        return 1
+    elapsed = time.perf_counter() - start
     conn.close()
 
+    for table_name, count in counts.items():
+        print(f"{table_name}: {count} rows")
+    print(f"Imported {sum(counts.values())} rows in {elapsed:.2f} seconds")
+    return 0
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
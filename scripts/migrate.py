@@ -0,0 +1,111 @@
+"""
+This module applies the numbered SQL files in scripts/migrations that the database hasn't seen yet
+and records each one in the Schema_Migrations table
+"""
+import sys
+import os
+import re
+import argparse
+from dataimport import initialize_connection
+from storage import get_backend, DatabaseError
+
+SCRIPT_PATH = __file__
+MIGRATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(SCRIPT_PATH)), 'migrations')
+MIGRATION_NAME = re.compile(r'^(\d+)_([\w-]+)\.sql$')
+
+def find_migrations(path=MIGRATIONS_PATH):
+    """
+    Lists migration files in version order
+
+    Returns:
+        list: tuples of (version, name, file path)
+    """
+    migrations = []
+    for file_name in os.listdir(path):
+        match = MIGRATION_NAME.match(file_name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(path, file_name)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Two migrations share a version number")
+    return migrations
+
+def applied_versions(cursor):
+    """
+    Creates the Schema_Migrations table if needed and reads which versions are applied
+
+    Returns:
+        set: applied version numbers
+    """
+    cursor.execute("""CREATE TABLE IF NOT EXISTS Schema_Migrations
+        (
+          Version INT NOT NULL,
+          Name VARCHAR(255) NOT NULL,
+          Applied_At TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          PRIMARY KEY (Version)
+        )""")
+    cursor.execute("SELECT Version FROM Schema_Migrations;")
+    return {row[0] for row in cursor.fetchall()}
+
+def migrate(conn, migrations, dry_run=False):
+    """
+    Applies every migration that isn't recorded yet, in order
+    MariaDB commits DDL implicitly, so each migration is recorded right after it runs.
+    On SQLite the statements are rewritten by the backend first.
+
+    Returns:
+        list: (version, name) of the migrations applied
+    """
+    cursor = conn.cursor()
+    applied = applied_versions(cursor)
+    done = []
+    for version, name, path in migrations:
+        if version in applied:
+            continue
+        print(f"Applying {version:04d}_{name}")
+        if not dry_run:
+            with open(path, encoding="utf-8") as file:
+                for statement in get_backend().script_statements(file.read()):
+                    cursor.execute(statement)
+            cursor.execute("INSERT INTO Schema_Migrations (Version, Name) VALUES (%s, %s);", (version, name))
+            conn.commit()
+        done.append((version, name))
+    return done
+
+def main():
+    """
+    Main function for module
+
+    Returns:
+        int: 0 for success, error codes if any
+    """
+    parser = argparse.ArgumentParser(description="Apply pending database migrations")
+    parser.add_argument('--status', action='store_true', help="Only list applied and pending migrations")
+    parser.add_argument('--dry-run', action='store_true', help="Show what would be applied without running it")
+    args = parser.parse_args()
+
+    migrations = find_migrations()
+    conn = initialize_connection()
+    try:
+        if args.status:
+            applied = applied_versions(conn.cursor())
+            for version, name, _ in migrations:
+                state = 'applied' if version in applied else 'pending'
+                print(f"{version:04d}_{name}: {state}")
+            return 0
+        done = migrate(conn, migrations, dry_run=args.dry_run)
+    except DatabaseError as e:
+        print(f"Migration failed: {e}")
+        return 1
+    finally:
+        conn.close()
+
+    if not done:
+        print("Database is up to date")
+    else:
+        print(f"Applied {len(done)} migration(s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+-- Version row bumped by dataimport.py so webservers know to reload cached reference data
+CREATE TABLE IF NOT EXISTS Reference_Version
+(
+  ID INT NOT NULL,
+  Version BIGINT UNSIGNED NOT NULL,
+  PRIMARY KEY (ID)
+);
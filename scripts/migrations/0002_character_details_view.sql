@@ -0,0 +1,14 @@
+-- Replaces the old CharacterDetails view, which returned one row per skill and saving throw pair
+-- and left out characters without a background, with one that returns one row per character
+CREATE OR REPLACE VIEW CharacterDetails AS
+SELECT
+    c.*,
+    r.RaceName, r.Page_Number AS Race_Page_Number,
+    b.BackgroundName, b.Page_Number AS Background_Page_Number,
+    cl.ClassName, cl.Page_Number AS Class_Page_Number,
+    (SELECT JSON_ARRAYAGG(JSON_ARRAY(s.SkillName, s.Modifier, s.Proficiency)) FROM Skills s WHERE s.ID = c.ID) AS Skills,
+    (SELECT JSON_ARRAYAGG(JSON_ARRAY(st.Saving_ThrowName, st.Modifier, st.Proficiency)) FROM Saving_Throws st WHERE st.ID = c.ID) AS Saving_Throws
+FROM Characters c
+JOIN Race r ON c.RaceID = r.RaceID
+LEFT JOIN Background b ON c.BackgroundID = b.BackgroundID
+JOIN Class cl ON c.ClassID = cl.ClassID;
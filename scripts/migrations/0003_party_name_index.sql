@@ -0,0 +1,2 @@
+-- Backs the name prefix filter on the party directory
+CREATE INDEX IF NOT EXISTS Party_Name ON Party (Name);
@@ -0,0 +1,3 @@
+-- Covers the party membership lookup behind the party roster page
+-- (WHERE Users.ID = ? ORDER BY username)
+CREATE INDEX IF NOT EXISTS Users_Party ON Users (ID, username);
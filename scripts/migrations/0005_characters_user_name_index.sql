@@ -0,0 +1,2 @@
+-- Looking up a user's characters by name, and listing them, without touching other users' rows
+CREATE INDEX IF NOT EXISTS Characters_User_Name ON Characters (username, CharacterName);
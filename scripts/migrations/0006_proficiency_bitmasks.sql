@@ -0,0 +1,52 @@
+-- Stores skill and saving throw proficiencies as bitmasks on the character row instead of one
+-- Skills or Saving_Throws row each. Bit n stands for the nth saving throw or skill in
+-- data/skills-and-saving-throws.json. Modifiers are no longer stored, webserver/derivedstats.py
+-- computes them from the ability scores and proficiency bonus.
+ALTER TABLE Characters ADD COLUMN IF NOT EXISTS Saving_Throw_Proficiencies INT NOT NULL DEFAULT 0;
+ALTER TABLE Characters ADD COLUMN IF NOT EXISTS Skill_Proficiencies INT NOT NULL DEFAULT 0;
+ALTER TABLE Characters ADD COLUMN IF NOT EXISTS Skill_Expertise INT NOT NULL DEFAULT 0;
+UPDATE Characters SET
+    Saving_Throw_Proficiencies = (
+        SELECT COALESCE(SUM(CASE st.Saving_ThrowName
+            WHEN 'Strength' THEN 1
+            WHEN 'Dexterity' THEN 2
+            WHEN 'Constitution' THEN 4
+            WHEN 'Intelligence' THEN 8
+            WHEN 'Wisdom' THEN 16
+            WHEN 'Charisma' THEN 32
+            ELSE 0 END), 0)
+        FROM Saving_Throws st WHERE st.ID = Characters.ID AND st.Proficiency = 1),
+    Skill_Proficiencies = (
+        SELECT COALESCE(SUM(CASE s.SkillName
+            WHEN 'Athletics' THEN 1
+            WHEN 'Acrobatics' THEN 2
+            WHEN 'Sleight of Hand' THEN 4
+            WHEN 'Stealth' THEN 8
+            WHEN 'Arcana' THEN 16
+            WHEN 'History' THEN 32
+            WHEN 'Investigation' THEN 64
+            WHEN 'Nature' THEN 128
+            WHEN 'Religion' THEN 256
+            WHEN 'Animal Handling' THEN 512
+            WHEN 'Insight' THEN 1024
+            WHEN 'Medicine' THEN 2048
+            WHEN 'Perception' THEN 4096
+            WHEN 'Survival' THEN 8192
+            WHEN 'Deception' THEN 16384
+            WHEN 'Intimidation' THEN 32768
+            WHEN 'Performance' THEN 65536
+            WHEN 'Persuasion' THEN 131072
+            ELSE 0 END), 0)
+        FROM Skills s WHERE s.ID = Characters.ID AND s.Proficiency = 1);
+CREATE OR REPLACE VIEW CharacterDetails AS
+SELECT
+    c.*,
+    r.RaceName, r.Page_Number AS Race_Page_Number,
+    b.BackgroundName, b.Page_Number AS Background_Page_Number,
+    cl.ClassName, cl.Page_Number AS Class_Page_Number
+FROM Characters c
+JOIN Race r ON c.RaceID = r.RaceID
+LEFT JOIN Background b ON c.BackgroundID = b.BackgroundID
+JOIN Class cl ON c.ClassID = cl.ClassID;
+DROP TABLE IF EXISTS Skills;
+DROP TABLE IF EXISTS Saving_Throws;
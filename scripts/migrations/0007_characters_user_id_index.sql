@@ -0,0 +1,4 @@
+-- Pages through a user's characters in ID order without sorting them
+-- (WHERE username = ? AND ID > ? ORDER BY ID). Replaces Characters_User_Name, which nothing orders by.
+CREATE INDEX IF NOT EXISTS Characters_User_ID ON Characters (username, ID);
+DROP INDEX IF EXISTS Characters_User_Name ON Characters;
@@ -0,0 +1,37 @@
+"""
+This module creates the tables from database-setup.sql on the database backend configured in .env.
+With dbbackend=sqlite it is how the SQLite file gets its schema; MariaDB users can still source
+database-setup.sql from the mariadb client instead.
+"""
+import sys
+import os
+from dataimport import initialize_connection
+from storage import run_script, DatabaseError
+
+SCRIPT_PATH = __file__
+SETUP_PATH = os.path.join(os.path.dirname(os.path.abspath(SCRIPT_PATH)), 'database-setup.sql')
+
+def main():
+    """
+    Main function for module
+
+    Returns:
+        int: 0 for success, error codes if any
+    """
+    with open(SETUP_PATH, encoding="utf-8") as file:
+        sql = file.read()
+
+    conn = initialize_connection()
+    try:
+        run_script(conn, sql)
+    except DatabaseError as e:
+        print(f"Could not create the schema, is it already set up? {e}")
+        return 1
+    finally:
+        conn.close()
+
+    print("Schema created. Run dataimport.py and migrate.py next")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,3 @@
-SELECT * FROM Skills;
-SELECT * FROM Saving_Throws;
 SELECT * FROM Characters;
 SELECT * FROM Users;
 SELECT * FROM Party;
@@ -0,0 +1,300 @@
+"""
+Contains a small thread-safe connection pool used by dbutilities
+"""
+import threading
+import time
+from collections import deque
+
+# Seconds between looks for abandoned connections while waiting for a free one
+ABANDONED_CHECK_INTERVAL = 0.1
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection could be checked out before the timeout ran out
+    """
+
+
+class PooledConnection:
+    """
+    Wraps a raw database connection that was borrowed from a ConnectionPool.
+    Calling close() hands the connection back to the pool instead of closing it,
+    so existing code written as connect/close keeps working unchanged.
+    """
+    __slots__ = ('_pool', '_raw', '_created', '_cursors')
+
+    def __init__(self, pool, raw, created):
+        self._pool = pool
+        self._raw = raw
+        self._created = created
+        self._cursors = []
+
+    def cursor(self, *args, **kwargs):
+        """
+        Opens a cursor that is closed automatically when the connection is released
+        """
+        cursor = self._raw.cursor(*args, **kwargs)
+        if self._pool.wrap_cursor is not None:
+            cursor = self._pool.wrap_cursor(cursor)
+        self._cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        """
+        Returns the connection to the pool
+        """
+        if self._raw is None:
+            return
+        for cursor in self._cursors:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self._cursors = []
+        raw, self._raw = self._raw, None
+        self._pool.release(raw, self._created)
+
+    def __del__(self):
+        # Garbage collected without close(), e.g. because a helper raised before reaching it.
+        # Hand the connection to the pool to reclaim on its next checkout so the slot isn't lost.
+        try:
+            if self._raw is not None:
+                raw, self._raw = self._raw, None
+                self._pool.abandon(raw, self._created)
+        except Exception:
+            pass
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise AttributeError(f"Connection already returned to pool: {name}")
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._raw is not None:
+            try:
+                self._raw.rollback()
+            except Exception:
+                pass
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    Keeps between min_size and max_size open connections around for reuse
+
+    Args:
+        connect (callable): Opens a brand new raw connection
+        min_size (int): Connections opened up front and kept idle
+        max_size (int): Hard cap on connections open at the same time
+        timeout (float): Seconds acquire() waits for a free connection
+        max_age (float): Seconds after which a connection is closed and replaced
+        health_check (bool): Ping idle connections before handing them out
+        wrap_cursor (callable): Optional wrapper applied to every cursor handed out
+    """
+    def __init__(self, connect, min_size=1, max_size=10, timeout=5.0, max_age=1800.0, health_check=True, wrap_cursor=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.health_check = health_check
+        self.wrap_cursor = wrap_cursor
+
+        self._lock = threading.Condition()
+        self._idle = deque()
+        # Connections whose PooledConnection was dropped without close(). Appending to a deque
+        # is thread-safe, so __del__ can do it without taking the lock.
+        self._abandoned = deque()
+        self._open = 0
+        self._in_use = 0
+        self._closed = False
+        self._counters = {
+            'checkouts': 0,
+            'creations': 0,
+            'recycled': 0,
+            'failed_health_checks': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'reclaimed': 0,
+            'wait_time': 0.0,
+        }
+
+        for _ in range(min_size):
+            with self._lock:
+                self._open += 1
+            raw = self._create()
+            with self._lock:
+                self._idle.append((raw, time.monotonic()))
+
+    def _create(self):
+        """
+        Opens a new raw connection into a slot the caller already reserved
+        """
+        try:
+            raw = self._connect()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._counters['creations'] += 1
+        return raw
+
+    def _discard(self, raw):
+        """
+        Closes a raw connection and frees its slot in the pool
+        """
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._lock.notify()
+
+    def _healthy(self, raw, created):
+        """
+        Whether an idle connection can be handed out again
+        """
+        if self.max_age and time.monotonic() - created > self.max_age:
+            with self._lock:
+                self._counters['recycled'] += 1
+            return False
+        if self.health_check:
+            try:
+                raw.ping()
+            except Exception:
+                with self._lock:
+                    self._counters['failed_health_checks'] += 1
+                return False
+        return True
+
+    def abandon(self, raw, created):
+        """
+        Queues a connection that was never given back, to be released on the next checkout
+        """
+        self._abandoned.append((raw, created))
+
+    def _reclaim_abandoned(self):
+        """
+        Releases every abandoned connection, rolling back whatever it left open
+
+        Returns:
+            bool: whether any were reclaimed
+        """
+        reclaimed = False
+        while True:
+            try:
+                raw, created = self._abandoned.popleft()
+            except IndexError:
+                return reclaimed
+            with self._lock:
+                self._counters['reclaimed'] += 1
+            self.release(raw, created)
+            reclaimed = True
+
+    def acquire(self, timeout=None):
+        """
+        Borrows a connection, opening a new one if the pool isn't full yet
+
+        Returns:
+            PooledConnection: Use it in a with block, or call close() on it, to give it back
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        start = time.monotonic()
+        while True:
+            self._reclaim_abandoned()
+            with self._lock:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                while not self._idle and self._open >= self.max_size and not self._abandoned:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection free after {timeout} seconds")
+                    if not waited:
+                        waited = True
+                        self._counters['waits'] += 1
+                    # Abandoned connections come back without a notify, so look for them now and then
+                    self._lock.wait(min(remaining, ABANDONED_CHECK_INTERVAL))
+                if not self._idle and self._open >= self.max_size:
+                    # Only abandoned connections are left, reclaim them first
+                    continue
+                if waited:
+                    self._counters['wait_time'] += time.monotonic() - start
+                    waited = False
+                idle = self._idle.pop() if self._idle else None
+                if idle is None:
+                    self._open += 1
+
+            if idle is None:
+                raw, created = self._create(), time.monotonic()
+            else:
+                raw, created = idle
+                if not self._healthy(raw, created):
+                    self._discard(raw)
+                    continue
+
+            with self._lock:
+                self._in_use += 1
+                self._counters['checkouts'] += 1
+            return PooledConnection(self, raw, created)
+
+    def release(self, raw, created):
+        """
+        Takes back a connection. Anything left uncommitted is rolled back
+        so the next borrower starts from a clean transaction.
+        """
+        with self._lock:
+            self._in_use -= 1
+        try:
+            raw.rollback()
+        except Exception:
+            self._discard(raw)
+            return
+        with self._lock:
+            if not self._closed:
+                self._idle.append((raw, created))
+                self._lock.notify()
+                return
+        self._discard(raw)
+
+    def close(self):
+        """
+        Closes all idle connections. Borrowed ones are closed when released.
+        """
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._lock.notify_all()
+        for raw, _ in idle:
+            self._discard(raw)
+
+    def stats(self):
+        """
+        Snapshot of pool usage
+
+        Returns:
+            dict: sizes plus counters for checkouts, creations, waits and so on
+        """
+        with self._lock:
+            result = dict(self._counters)
+            result.update({
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            })
+        return result
@@ -2,79 +2,257 @@
 Contains only functions that interact with the database
 """
 import os
-import mariadb
+import logging
+import threading
 from dotenv import load_dotenv
+from dbpool import ConnectionPool
+from storage import get_backend, DatabaseError, IntegrityError
+from refcache import ReferenceCache
+from models import Character
+from metrics import InstrumentedCursor, record_connection
 
-def initialize_connection():
+load_dotenv()
+
+logger = logging.getLogger('dbutilities')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _open_connection():
     """
-    Initializes connection to database
+    Opens a brand new connection through the backend configured in .env
 
     Returns:
-        mariadb.connections.Connection: Object for interacting with the database
-    """
-    load_dotenv()
-    dbuser = os.getenv('dbuser')
-    dbpassword = os.getenv('dbpassword')
-    dbhost = os.getenv('dbhost')
-    dbport = os.getenv('dbport')
-    dbname = os.getenv('dbname')
+        Connection: Object for interacting with the database
+    """
+    backend = get_backend()
     try:
-        connection = mariadb.connect(
-            user=dbuser,
-            password=dbpassword,
-            host=dbhost,
-            port=int(dbport),
-            database=dbname
-        )
-    except mariadb.Error as e:
-        print(f"Error connecting to MariaDB Platform: {e}")
-    return connection
+        return backend.connect()
+    except DatabaseError as e:
+        logger.error("could not connect to database %s error=%s", backend.describe(), e)
+        raise
+
+def get_pool():
+    """
+    Gets the process-wide connection pool, creating it on first use
+
+    Returns:
+        ConnectionPool: Pool that every helper in this module borrows from
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    _open_connection,
+                    min_size=int(os.getenv('dbpool_min_size', '1')),
+                    max_size=int(os.getenv('dbpool_max_size', '10')),
+                    timeout=float(os.getenv('dbpool_timeout', '5')),
+                    max_age=float(os.getenv('dbpool_max_age', '1800')),
+                    health_check=os.getenv('dbpool_health_check', 'true').lower() == 'true',
+                    wrap_cursor=InstrumentedCursor
+                )
+    return _pool
+
+def get_pool_stats():
+    """
+    Gets usage statistics for the connection pool
+
+    Returns:
+        dict: in_use, idle, waits, creations and other counters
+    """
+    return get_pool().stats()
+
+def initialize_connection():
+    """
+    Borrows a connection from the pool. Use it in a with block so it goes back to the
+    pool, rolled back, even when a statement raises.
+    Statements run on its cursors are counted and timed by the metrics module.
+
+    Returns:
+        PooledConnection: Object for interacting with the database
+    """
+    conn = get_pool().acquire()
+    record_connection()
+    return conn
+
+REFERENCE_TABLES = ('Race', 'Class', 'Background')
+
+def _load_reference_tables():
+    """
+    Reads every reference table from the database on one connection
+
+    Returns:
+        dict: table name to list of (Name, Page_Number, ID) rows
+    """
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
+
+        tables = {}
+        for table_name in REFERENCE_TABLES:
+            query = f"SELECT {table_name}Name, Page_Number, {table_name}ID FROM {table_name} ORDER BY {table_name}ID" # Table names come from REFERENCE_TABLES
+            cursor.execute(query)
+            tables[table_name] = cursor.fetchall()
+    return tables
+
+def get_reference_version():
+    """
+    Gets the version of the reference data, bumped by scripts/dataimport.py on every import
+
+    Returns:
+        int: version, or None if the database doesn't track it
+    """
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("SELECT Version FROM Reference_Version WHERE ID = 1;")
+            result = cursor.fetchone()
+        except DatabaseError:
+            result = None
+
+    if result:
+        return result[0]
+    return None
+
+_reference_cache = ReferenceCache(
+    _load_reference_tables,
+    get_reference_version,
+    check_interval=float(os.getenv('refcache_check_interval', '60'))
+)
+
+def get_reference_table(table_name):
+    """
+    Gets a cached reference table with lookups by ID and by name
+
+    Args:
+        table_name (str): one of REFERENCE_TABLES
+
+    Returns:
+        ReferenceTable: cached rows of the table
+    """
+    return _reference_cache.table(table_name)
+
+def get_reference_generation():
+    """
+    Gets a number that changes whenever the cached reference tables are reloaded
+
+    Returns:
+        int: reload counter of the reference cache
+    """
+    return _reference_cache.generation
+
+def invalidate_reference_cache():
+    """
+    Forgets the cached reference tables so they are reloaded on next use
+    """
+    _reference_cache.invalidate()
 
 def get_table_contents(table_name):
     """
     Gets contents of a particular table
+    Reference tables are served from memory
 
     Returns:
         Result of query
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    if table_name in REFERENCE_TABLES:
+        return get_reference_table(table_name).rows
+
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-    query = f"SELECT * FROM {table_name}" # Bad formatting is fine since this isn't user-submitted
-    cursor.execute(query)
-    result = cursor.fetchall()
-    conn.close()
+        query = f"SELECT * FROM {table_name}" # Bad formatting is fine since this isn't user-submitted
+        cursor.execute(query)
+        result = cursor.fetchall()
     return result
 
-def is_user(username) -> bool:
+MAX_PAGE_SIZE = 100
+
+class Page:
     """
-    Gets all usernames
+    One page of a keyset paginated query
+    next_cursor and prev_cursor are the keys to pass as after and before, or None at either end
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    __slots__ = ('rows', 'next_cursor', 'prev_cursor')
 
-    query = "SELECT username from Users WHERE username = %s;"
-    cursor.execute(query, (username,))
-    print(cursor.rowcount > 0)
-    if cursor.rowcount > 0:
-        conn.close()
-        return True
-    conn.close()
-    return False
+    def __init__(self, rows, next_cursor, prev_cursor):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+def _fetch_page(cursor, select, conditions, params, key_column, key_index, after, before, page_size, model=None):
+    """
+    Runs a keyset (seek) paginated query so deep pages cost the same as the first one
+
+    Args:
+        select (str): SELECT ... FROM ... part of the query
+        conditions (list): WHERE conditions joined with AND
+        params (list): values for the placeholders in conditions
+        key_column (str): unique, indexed column to page on
+        key_index (int): position of key_column in each row
+        after: return rows with keys greater than this
+        before: return rows with keys less than this, takes priority over after
+        page_size (int): rows per page, capped at MAX_PAGE_SIZE
+        model: class with a from_row() classmethod to load each row into
+
+    Returns:
+        Page: rows in ascending key order plus cursors
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    conditions = list(conditions)
+    params = list(params)
+    if before is not None:
+        conditions.append(f"{key_column} < %s")
+        params.append(before)
+        order = "DESC"
+    else:
+        if after is not None:
+            conditions.append(f"{key_column} > %s")
+            params.append(after)
+        order = "ASC"
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    # Ask for one extra row to find out whether there is another page
+    query = f"{select}{where} ORDER BY {key_column} {order} LIMIT %s"
+    params.append(page_size + 1)
+    cursor.execute(query, tuple(params))
+    rows = cursor.fetchall()
+
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before is not None:
+        rows.reverse()
+        next_cursor = rows[-1][key_index] if rows else None
+        prev_cursor = rows[0][key_index] if rows and more else None
+    else:
+        next_cursor = rows[-1][key_index] if rows and more else None
+        prev_cursor = rows[0][key_index] if rows and after is not None else None
+    if model is not None:
+        rows = [model.from_row(row) for row in rows]
+    return Page(rows, next_cursor, prev_cursor)
 
 def create_user(username, hashed_password):
     """
     Adds a user to the Users table if they don't already exist
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-    query = "INSERT INTO Users (username, password) VALUES (%s, %s);"
-    cursor.execute(query, (username, hashed_password))
+        query = "INSERT INTO Users (username, password) VALUES (%s, %s);"
+        try:
+            cursor.execute(query, (username, hashed_password))
+        except IntegrityError:
+            # Username taken
+            return False
 
-    conn.commit()
-    rowcount = cursor.rowcount
-    conn.close()
+        conn.commit()
+        rowcount = cursor.rowcount
 
     return rowcount > 0
 
@@ -82,28 +260,26 @@ def delete_user(username):
     """
     Deletes a user from the database
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-    query = "DELETE FROM Users WHERE username=%s"
-    cursor.execute(query, (username,))
+        query = "DELETE FROM Users WHERE username=%s"
+        cursor.execute(query, (username,))
 
-    conn.commit()
-    conn.close()
+        conn.commit()
     return
 
 def delete_character(char_id):
     """
     Deletes a character from the database
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-    query = "DELETE FROM Characters WHERE ID=%s"
-    cursor.execute(query, (char_id,))
+        query = "DELETE FROM Characters WHERE ID=%s"
+        cursor.execute(query, (char_id,))
 
-    conn.commit()
-    conn.close()
+        conn.commit()
     return
 
 def add_totp(username, seed):
@@ -111,292 +287,321 @@ def add_totp(username, seed):
     Adds TOTP to a user's account
     Adds ability to reset password
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-    query = "UPDATE Users SET totpseed = %s WHERE username = %s;"
-    cursor.execute(query, (seed,username,))
-    conn.commit()
-    conn.close()
+        query = "UPDATE Users SET totpseed = %s WHERE username = %s;"
+        cursor.execute(query, (seed,username,))
+        conn.commit()
     return
 
-def get_totp_seed(username) -> str:
+class UserCredentials:
     """
-    Gets the stored TOTP seed for a user.
+    Everything login and TOTP checks need from one Users row
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    __slots__ = ('username', 'password_hash', 'totp_seed', 'party_id')
 
-    query = "SELECT totpseed FROM Users WHERE username = %s;"
-    cursor.execute(query, (username,))
-    result = cursor.fetchall()
+    def __init__(self, username, password_hash, totp_seed, party_id):
+        self.username = username
+        self.password_hash = password_hash
+        self.totp_seed = totp_seed
+        self.party_id = party_id
 
-    conn.close()
+    @property
+    def totp_enabled(self):
+        """
+        Whether the user has TOTP set up
+        """
+        return self.totp_seed is not None
 
-    if result:
-        return result[0][0]
-    else:
-        return None
-
-def totp_enabled(username):
+def get_user_credentials(username):
     """
-    Determine if a user has TOTP enabled
+    Gets username, password hash, TOTP seed and party ID for a user in one query
 
     Returns:
-        Bool: whether or not user has TOTP enabled
-    """
-    # Initialize connection to database
-    conn = initialize_connection()
-    cursor = conn.cursor()
-
-    query = "SELECT * from Users WHERE username = %s AND totpseed IS NOT NULL"
-    cursor.execute(query, (username,))
-    rowcount = cursor.rowcount
-    # Close connection to database when done to prevent hanging
-    conn.close()
-    #
-    return rowcount == 1
-
-def get_password_hash(username) -> str:
-    """
-    Gets the stored password hash for a user.
+        UserCredentials: or None if there is no such user
     """
-    print("Getting password")
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-    query = "SELECT password FROM Users WHERE username = %s;"
-    cursor.execute(query, (username,))
-    result = cursor.fetchall()
-
-    conn.close()
+        query = "SELECT username, password, totpseed, ID FROM Users WHERE username = %s;"
+        cursor.execute(query, (username,))
+        result = cursor.fetchone()
 
     if result:
-        return result[0][0]
-    else:
-        return None
+        return UserCredentials(*result)
+    return None
 
 def change_password_hash(username, new_hash):
     """
     Alter the user table with new password hash
     Returns whether password was successfully changed or not
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-    query = "UPDATE Users SET password = %s WHERE username = %s;"
-    cursor.execute(query, (new_hash, username,))
-    if cursor.rowcount > 0:
-        conn.commit()
-        conn.close()
-        return True
-    conn.close()
+        query = "UPDATE Users SET password = %s WHERE username = %s;"
+        cursor.execute(query, (new_hash, username,))
+        if cursor.rowcount > 0:
+            conn.commit()
+            return True
     return False
 
-def add_character(name, race_id, class_id, background_id, ability_scores, proficiency_bonus, username):
+def add_character_with_details(name, race_id, class_id, background_id, ability_scores, proficiency_bonus, username, saving_throw_proficiencies, skill_proficiencies, skill_expertise):
     """
-    Adds a character to the database
-    """
-    conn = initialize_connection()
-    cursor = conn.cursor()
-
-    query = "INSERT INTO Characters (CharacterName, RaceID, ClassID, BackgroundID, Strength_Ability_Score, Dexterity_Ability_Score, Constitution_Ability_Score, Intelligence_Ability_Score, Wisdom_Ability_Score, Charisma_Ability_Score, Proficiency_bonus, username) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);"
-    cursor.execute(query, (name, race_id, class_id, background_id, ability_scores[0], ability_scores[1], ability_scores[2], ability_scores[3], ability_scores[4], ability_scores[5], proficiency_bonus, username))
+    Adds a character including its proficiencies, all in the one Characters row
 
-    character_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return character_id
+    Args:
+        saving_throw_proficiencies (int): saving throw bitmask, see derivedstats
+        skill_proficiencies (int): skill bitmask
+        skill_expertise (int): skill expertise bitmask
 
-def add_saving_throw(character_id, name, modifier, proficiency):
-    """
-    Add a saving throw to a character
+    Returns:
+        int: ID of the new character
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-    query = "INSERT INTO Saving_Throws (ID, Saving_ThrowName, Modifier, Proficiency) VALUES (%s, %s, %s, %s);"
-    cursor.execute(query, (character_id, name, modifier, proficiency))
+        query = "INSERT INTO Characters (CharacterName, RaceID, ClassID, BackgroundID, Strength_Ability_Score, Dexterity_Ability_Score, Constitution_Ability_Score, Intelligence_Ability_Score, Wisdom_Ability_Score, Charisma_Ability_Score, Proficiency_bonus, username, Saving_Throw_Proficiencies, Skill_Proficiencies, Skill_Expertise) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);"
+        cursor.execute(query, (name, race_id, class_id, background_id, ability_scores[0], ability_scores[1], ability_scores[2], ability_scores[3], ability_scores[4], ability_scores[5], proficiency_bonus, username, saving_throw_proficiencies, skill_proficiencies, skill_expertise))
 
-    conn.commit()
-    conn.close()
+        character_id = cursor.lastrowid
+        conn.commit()
+    return character_id
 
-    return None
+# Columns Character.from_row() loads, in order. Queries join Race r, Class cl and Background b.
+CHARACTER_FIELDS = """c.ID, c.CharacterName, c.Strength_Ability_Score, c.Dexterity_Ability_Score, c.Constitution_Ability_Score, c.Intelligence_Ability_Score, c.Wisdom_Ability_Score, c.Charisma_Ability_Score,
+        c.Proficiency_bonus, c.username, c.BackgroundID, c.RaceID, c.ClassID, c.Saving_Throw_Proficiencies, c.Skill_Proficiencies, c.Skill_Expertise,
+        r.RaceName, cl.ClassName, b.BackgroundName"""
+
+CHARACTER_COLUMNS = (
+    'CharacterName',
+    'Strength_Ability_Score',
+    'Dexterity_Ability_Score',
+    'Constitution_Ability_Score',
+    'Intelligence_Ability_Score',
+    'Wisdom_Ability_Score',
+    'Charisma_Ability_Score',
+    'Proficiency_bonus',
+    'BackgroundID',
+    'RaceID',
+    'ClassID',
+    'Saving_Throw_Proficiencies',
+    'Skill_Proficiencies',
+    'Skill_Expertise',
+)
+
+def update_character(cursor, character_id, changes):
+    """
+    Update only the given columns of a character using an open cursor
 
-def get_saving_throws(character_id):
-    """
-    Gets saving throws for a particular character
+    Args:
+        changes (dict): column name from CHARACTER_COLUMNS to its new value
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
-    query = "SELECT * from Saving_Throws WHERE ID=%s;"
-    cursor.execute(query,(character_id,))
-    result = cursor.fetchall()
-    conn.close()
-    return result
+    if not changes:
+        return
+    for column in changes:
+        if column not in CHARACTER_COLUMNS:
+            raise ValueError(f"Unknown character column: {column}")
+    assignments = ", ".join(f"{column} = %s" for column in changes)
+    query = f"UPDATE Characters SET {assignments} WHERE ID = %s;" # Column names are checked against CHARACTER_COLUMNS
+    cursor.execute(query, (*changes.values(), character_id))
 
-def get_skills(character_id):
-    """
-    Gets skills for a particular character
+def update_character_with_details(character_id, changes):
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
-    query = "SELECT * from Skills WHERE ID=%s;"
-    cursor.execute(query,(character_id,))
-    result = cursor.fetchall()
-    conn.close()
-    return result
+    Apply changes to a character, including its proficiency bitmasks
+    The character keeps its ID
 
-def update_skill():
-    """
+    Args:
+        changes (dict): changed Characters columns and their new values
     """
-    return
+    if not changes:
+        return
+    # Leaving the with block early rolls back and gives the connection back to the pool
+    with initialize_connection() as conn:
+        update_character(conn.cursor(), character_id, changes)
+        conn.commit()
 
-def update_saving_throw():
+def add_party(name):
     """
+    Adds a party to the database
     """
-    return
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-def update_character():
-    """
-    """
+        query = "INSERT INTO Party (Name) VALUES (%s);"
+        cursor.execute(query, (name,))
+
+        conn.commit()
     return
 
-def update_character_details(character_id, name, race_id, class_id, background_id, ability_scores, proficiency_bonus):
+def get_parties(after=None, before=None, page_size=50, name_prefix=None):
     """
-    Update details for a character in the database
-    """
-    conn = initialize_connection()
-    cursor = conn.cursor()
-
-    query = "UPDATE Characters SET CharacterName = %s, RaceID = %s, ClassID = %s, BackgroundID = %s, Strength_Ability_Score = %s, Dexterity_Ability_Score = %s, Constitution_Ability_Score = %s, Intelligence_Ability_Score = %s, Wisdom_Ability_Score = %s, Charisma_Ability_Score = %s, Proficiency_bonus = %s WHERE ID = %s;"
-    cursor.execute(query, (name, race_id, class_id, background_id, ability_scores[0], ability_scores[1], ability_scores[2], ability_scores[3], ability_scores[4], ability_scores[5], proficiency_bonus, character_id))
+    Shows a page of parties that a user can join
 
-    conn.commit()
-    conn.close()
+    Args:
+        after (int): party ID to continue after
+        before (int): party ID to go back from
+        page_size (int): parties per page
+        name_prefix (str): only parties whose name starts with this
 
-def add_skill(character_id, name, modifier, proficiency):
-    """
-    Add a skill to a character
+    Returns:
+        Page: rows of (ID, Name)
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-    query = "INSERT INTO Skills (ID, SkillName, Modifier, Proficiency) VALUES (%s, %s, %s, %s);"
-    cursor.execute(query, (character_id, name, modifier, proficiency))
+        conditions = []
+        params = []
+        if name_prefix:
+            # Prefix match so the Party name index can be used
+            # ! as the escape character, since MariaDB and SQLite disagree on backslashes in string literals
+            escaped = name_prefix.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+            conditions.append("Name LIKE %s ESCAPE '!'")
+            params.append(escaped + '%')
+        result = _fetch_page(cursor, "SELECT ID, Name FROM Party", conditions, params, "ID", 0, after, before, page_size)
 
-    conn.commit()
-    conn.close()
-    return
+    return result
 
-def add_party(name):
+def get_party_name(party_id):
     """
-    Adds a party to the database
-    """
-    conn = initialize_connection()
-    cursor = conn.cursor()
-
-    query = "INSERT INTO Party (Name) VALUES (%s);"
-    cursor.execute(query, (name,))
-
-    conn.commit()
-    conn.close()
-    return
+    Gets the name of a party
 
-def get_parties():
-    """
-    Shows all parties that a user can join
+    Returns:
+        str: party name, or None if there is no such party
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    if party_id is None:
+        return None
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-    query = "SELECT * FROM Party;"
-    cursor.execute(query)
-    result = cursor.fetchall()
-    conn.close()
+        query = "SELECT Name FROM Party WHERE ID = %s;"
+        cursor.execute(query, (party_id,))
+        result = cursor.fetchone()
 
-    return result
+    if result:
+        return result[0]
+    return None
 
 def update_user_party_id(partyID, username):
     """
     Updates a user to have a PartyID
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-    query = "UPDATE Users SET ID = %s WHERE username = %s;"
-    cursor.execute(query, (partyID, username,))
-    conn.commit()
-    conn.close()
+        query = "UPDATE Users SET ID = %s WHERE username = %s;"
+        cursor.execute(query, (partyID, username,))
+        conn.commit()
     
-def get_user_party_id(user):
-    """
-    Gets a users party ID
+def get_party_roster(party_id):
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
+    Gets every member of a party with their characters in one query
 
-    query = "SELECT ID FROM Users WHERE username = %s;"
-    cursor.execute(query, (user,))
-    result = cursor.fetchall()
-    conn.close()
+    Args:
+        party_id (int): unique party ID
 
-    return result[0][0]
-    return None
+    Returns:
+        list: tuples of (username, Character), in username order. Members without
+        characters get a single tuple with the character set to None
+    """
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
+
+        query = "SELECT u.username, " + CHARACTER_FIELDS + """
+            FROM Users u
+            LEFT JOIN Characters c ON c.username = u.username
+            LEFT JOIN Race r ON c.RaceID = r.RaceID
+            LEFT JOIN Class cl ON c.ClassID = cl.ClassID
+            LEFT JOIN Background b ON c.BackgroundID = b.BackgroundID
+            WHERE u.ID = %s
+            ORDER BY u.username, c.ID"""
+        cursor.execute(query, (party_id,))
+        result = [(row[0], Character.from_row(row[1:]) if row[1] is not None else None) for row in cursor.fetchall()]
+
+    return result
 
 
-def get_one_character(character_id):
+def get_character_sheet(character_id):
     """
-    Show character info for one single character.
-    
+    Load a whole character sheet in one query
+
     Args:
         character_id (int): unique character ID
-    """
-    conn = initialize_connection()
-    cursor = conn.cursor()
-
-    query = "SELECT * FROM Characters WHERE ID = %s"
-    cursor.execute(query, (character_id,))
-    result = cursor.fetchall()
-    conn.close()
-
-    return result[0]
 
+    Returns:
+        Character: or None if there is no such character. derivedstats turns its
+        proficiency bitmasks into saving throws and skills.
+    """
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
+
+        query = "SELECT " + CHARACTER_FIELDS + """
+            FROM Characters c
+            JOIN Race r ON c.RaceID = r.RaceID
+            JOIN Class cl ON c.ClassID = cl.ClassID
+            LEFT JOIN Background b ON c.BackgroundID = b.BackgroundID
+            WHERE c.ID = %s"""
+        cursor.execute(query, (character_id,))
+        result = cursor.fetchone()
+
+    if result is None:
+        return None
+    return Character.from_row(result)
 
-def get_user_characters(username):
+def get_characters(character_ids, username):
     """
-    Show all characters linked to specific user ID
+    Load many character sheets a user may see in one query: their own and their party's
 
     Args:
-        user_id (int): unique user ID
-    """
-    conn = initialize_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT CharacterName, RaceID, ClassID, BackgroundID, ID FROM Characters WHERE username = %s"
-    cursor.execute(query, (username,))
-    result = cursor.fetchall()
-    conn.close()
-    
-    return result
+        character_ids (list): unique character IDs, at least one
+        username (str): user asking for the characters
+
+    Returns:
+        list: Character records in ID order. IDs without a character the user may see are left out.
+    """
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
+
+        query = "SELECT " + CHARACTER_FIELDS + """
+            FROM Characters c
+            JOIN Users u ON u.username = c.username
+            JOIN Race r ON c.RaceID = r.RaceID
+            JOIN Class cl ON c.ClassID = cl.ClassID
+            LEFT JOIN Background b ON c.BackgroundID = b.BackgroundID
+            WHERE c.ID IN (%s) AND (c.username = %%s OR u.ID = (SELECT ID FROM Users WHERE username = %%s))
+            ORDER BY c.ID"""
+        # One placeholder per ID
+        cursor.execute(query % ', '.join(['%s'] * len(character_ids)), (*character_ids, username, username))
+        result = [Character.from_row(row) for row in cursor.fetchall()]
 
+    return result
 
-def get_race_name(race_id):
+def get_user_character_summaries(username, after=None, before=None, page_size=MAX_PAGE_SIZE):
     """
-    Get the RaceName associated with race ID
+    Show a page of characters linked to a user, with race, class and background names,
+    in a single query
 
     Args:
-        race_id (int): unique Race ID
+        username (str): owner of the characters
+        after (int): character ID to continue after
+        before (int): character ID to go back from
+        page_size (int): characters per page
+
+    Returns:
+        Page: Character rows
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT RaceName FROM Race WHERE RaceID = %s"
-    cursor.execute(query, (race_id,))
-    result = cursor.fetchone()
-    conn.close()
-    
-    return result[0]
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
+
+        select = "SELECT " + CHARACTER_FIELDS + """
+            FROM Characters c
+            JOIN Race r ON c.RaceID = r.RaceID
+            JOIN Class cl ON c.ClassID = cl.ClassID
+            LEFT JOIN Background b ON c.BackgroundID = b.BackgroundID"""
+        result = _fetch_page(cursor, select, ["c.username = %s"], [username], "c.ID", 0, after, before, page_size, model=Character)
+
+    return result
 
 def get_character_name(character_id):
     """
@@ -405,46 +610,12 @@ def get_character_name(character_id):
     Args:
         race_id (int): unique Race ID
     """
-    conn = initialize_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT CharacterName FROM Characters WHERE ID = %s"
-    cursor.execute(query, (character_id,))
-    result = cursor.fetchone()
-    conn.close()
-    
-    return result[0]
-
-def get_class_name(class_id):
-    """
-    Get the classname associated with race ID
+    with initialize_connection() as conn:
+        cursor = conn.cursor()
 
-    Args:
-        class_id (int): unique class ID
-    """
-    conn = initialize_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT ClassName FROM Class WHERE ClassID = %s"
-    cursor.execute(query, (class_id,))
-    result = cursor.fetchone()
-    conn.close()
+        query = "SELECT CharacterName FROM Characters WHERE ID = %s"
+        cursor.execute(query, (character_id,))
+        result = cursor.fetchone()
     
     return result[0]
 
-def get_background_name(background_id):
-    """
-    Get the background associated with race ID
-
-    Args:
-        background_id (int): unique background ID
-    """
-    conn = initialize_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT BackgroundName FROM Background WHERE BackgroundID = %s"
-    cursor.execute(query, (background_id,))
-    result = cursor.fetchone()
-    conn.close()
-    
-    return result[0]
@@ -0,0 +1,83 @@
+"""
+Contains the character stats derived from ability scores, proficiency bonus and the proficiency bitmasks
+stored on each Characters row
+
+Bit n of a saving throw mask stands for the nth ability in the rules JSON, and bit n of a skill
+mask for the nth skill, so new skills have to be added at the end of the JSON.
+"""
+from rules import get_rules
+from models import SavingThrow, Skill
+from serverutilities import calculate_modifier
+
+
+def to_mask(names, index):
+    """
+    Packs names into a bitmask
+
+    Args:
+        names: names to set, each a key of index
+        index (mapping): name to bit position, like Rules.skill_index
+
+    Returns:
+        int: bitmask
+    """
+    mask = 0
+    for name in names:
+        mask |= 1 << index[name]
+    return mask
+
+
+def from_mask(mask, names):
+    """
+    Unpacks a bitmask
+
+    Args:
+        mask (int): bitmask
+        names (tuple): names in bit order, like Rules.abilities
+
+    Returns:
+        tuple: names whose bit is set
+    """
+    return tuple(name for position, name in enumerate(names) if mask >> position & 1)
+
+
+def saving_throws(character):
+    """
+    Saving throws of a character in ability order
+
+    Args:
+        character (Character): character with its saving throw proficiency bitmask
+
+    Returns:
+        list: SavingThrow records
+    """
+    bonus = character.proficiency_bonus
+    proficiencies = character.saving_throw_proficiencies
+    throws = []
+    for position, (ability, score) in enumerate(zip(get_rules().abilities, character.ability_scores)):
+        proficient = bool(proficiencies >> position & 1)
+        throws.append(SavingThrow(ability, calculate_modifier(score) + (bonus if proficient else 0), proficient))
+    return throws
+
+
+def skills(character):
+    """
+    Skills of a character in sheet order
+    Expertise doubles the proficiency bonus and counts as proficiency on its own
+
+    Args:
+        character (Character): character with its skill proficiency and expertise bitmasks
+
+    Returns:
+        list: Skill records
+    """
+    rules = get_rules()
+    bonus = character.proficiency_bonus
+    modifiers = [calculate_modifier(score) for score in character.ability_scores]
+    result = []
+    for position, (skill, ability) in enumerate(rules.skills.items()):
+        expert = bool(character.skill_expertise >> position & 1)
+        proficient = expert or bool(character.skill_proficiencies >> position & 1)
+        modifier = modifiers[rules.ability_index[ability]] + bonus * (2 if expert else 1 if proficient else 0)
+        result.append(Skill(skill, modifier, proficient, expert))
+    return result
@@ -0,0 +1,217 @@
+"""
+Contains the NumPy dice engine for ability scores: 4d6 drop lowest rolls, the standard array,
+point-buy validation and exact or Monte Carlo score and modifier distributions.
+Everything works on whole batches at once, so rolling hundreds of sets for a table of players
+is a handful of array operations.
+"""
+from functools import lru_cache
+import numpy as np
+
+ABILITY_COUNT = 6
+STANDARD_ARRAY = (15, 14, 13, 12, 10, 8)
+
+POINT_BUY_BUDGET = 27
+# Point-buy cost of each score. Scores outside 8 to 15 can't be bought.
+POINT_BUY_COSTS = {8: 0, 9: 1, 10: 2, 11: 3, 12: 4, 13: 5, 14: 7, 15: 9}
+_POINT_BUY_TABLE = np.full(31, -1, dtype=np.int16)
+for _score, _cost in POINT_BUY_COSTS.items():
+    _POINT_BUY_TABLE[_score] = _cost
+
+# Lowest and highest score 4d6 drop lowest and 3d6 can produce
+MIN_ROLL = 3
+MAX_ROLL = 18
+
+# Lowest and highest ability score the rules allow at all
+MIN_SCORE = 1
+MAX_SCORE = 30
+
+
+def modifiers(scores):
+    """
+    Ability modifiers of an array of scores, the same as serverutilities.calculate_modifier
+
+    Args:
+        scores: array-like of ability scores
+
+    Returns:
+        numpy.ndarray: (score - 10) // 2, rounded down like Python's //
+    """
+    # int64 so any integer a caller passes in fits
+    return (np.asarray(scores, dtype=np.int64) - 10) // 2
+
+
+def roll_4d6_drop_lowest(count, abilities=ABILITY_COUNT, rng=None):
+    """
+    Rolls ability score sets, each score the sum of the highest three of four d6
+
+    Args:
+        count (int): sets to roll
+        abilities (int): scores per set
+        rng (numpy.random.Generator): random source, a fresh one if None
+
+    Returns:
+        numpy.ndarray: int8 array of shape (count, abilities)
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    dice = rng.integers(1, 7, size=(count, abilities, 4), dtype=np.int8)
+    return dice.sum(axis=-1, dtype=np.int8) - dice.min(axis=-1)
+
+
+def roll_3d6(count, abilities=ABILITY_COUNT, rng=None):
+    """
+    Rolls ability score sets the old school way, each score the sum of three d6
+
+    Returns:
+        numpy.ndarray: int8 array of shape (count, abilities)
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    return rng.integers(1, 7, size=(count, abilities, 3), dtype=np.int8).sum(axis=-1, dtype=np.int8)
+
+
+ROLL_METHODS = {
+    '4d6': roll_4d6_drop_lowest,
+    '3d6': roll_3d6,
+}
+
+
+def best_sets(sets):
+    """
+    Picks the set with the highest total from each group of sets
+
+    Args:
+        sets: array of shape (..., sets per group, abilities)
+
+    Returns:
+        numpy.ndarray: array of shape (..., abilities)
+    """
+    sets = np.asarray(sets)
+    best = sets.sum(axis=-1, dtype=np.int16).argmax(axis=-1)
+    return np.take_along_axis(sets, best[..., np.newaxis, np.newaxis], axis=-2)[..., 0, :]
+
+
+def roll_best_of(players, sets, method='4d6', rng=None):
+    """
+    Rolls a number of sets for every player and keeps each player's best one
+
+    Args:
+        players (int): players at the table
+        sets (int): sets rolled per player
+        method (str): key of ROLL_METHODS
+
+    Returns:
+        numpy.ndarray: int8 array of shape (players, abilities)
+    """
+    rolled = ROLL_METHODS[method](players * sets, rng=rng).reshape(players, sets, ABILITY_COUNT)
+    return best_sets(rolled)
+
+
+def standard_arrays(count):
+    """
+    The standard array repeated for a batch of characters
+
+    Returns:
+        numpy.ndarray: int8 array of shape (count, abilities)
+    """
+    return np.tile(np.array(STANDARD_ARRAY, dtype=np.int8), (count, 1))
+
+
+def point_buy_cost(scores):
+    """
+    Point-buy cost of score sets
+
+    Args:
+        scores: array-like of shape (..., abilities)
+
+    Returns:
+        numpy.ndarray: total cost of each set, -1 where a score can't be bought
+    """
+    scores = np.asarray(scores, dtype=np.int64)
+    in_range = (scores >= 0) & (scores < len(_POINT_BUY_TABLE))
+    costs = np.where(in_range, _POINT_BUY_TABLE[np.clip(scores, 0, len(_POINT_BUY_TABLE) - 1)], -1)
+    buyable = (costs >= 0).all(axis=-1)
+    return np.where(buyable, costs.sum(axis=-1), -1)
+
+
+def valid_point_buy(scores, budget=POINT_BUY_BUDGET):
+    """
+    Whether score sets could have been bought with the point-buy budget
+
+    Args:
+        scores: array-like of shape (..., abilities)
+
+    Returns:
+        numpy.ndarray: bool for each set
+    """
+    cost = point_buy_cost(scores)
+    return (cost >= 0) & (cost <= budget)
+
+
+@lru_cache(maxsize=None)
+def _exact_score_probabilities(method):
+    """
+    Probability of every score from 0 to MAX_ROLL, by enumerating every way the dice can land
+    """
+    dice_count = 4 if method == '4d6' else 3
+    faces = np.indices((6,) * dice_count).reshape(dice_count, -1) + 1
+    totals = faces.sum(axis=0)
+    if method == '4d6':
+        totals = totals - faces.min(axis=0)
+    probabilities = np.bincount(totals, minlength=MAX_ROLL + 1) / totals.size
+    probabilities.flags.writeable = False
+    return probabilities
+
+
+def score_distribution(method='4d6', samples=None, rng=None):
+    """
+    Distribution of one ability score, exact or estimated from samples
+
+    Args:
+        method (str): key of ROLL_METHODS
+        samples (int): scores to roll for a Monte Carlo estimate, or None for the exact distribution
+
+    Returns:
+        dict: score to probability, for MIN_ROLL to MAX_ROLL
+    """
+    if method not in ROLL_METHODS:
+        raise ValueError(f"Unknown roll method: {method}")
+    if samples is None:
+        probabilities = _exact_score_probabilities(method)
+    else:
+        scores = ROLL_METHODS[method](samples, abilities=1, rng=rng).ravel()
+        probabilities = np.bincount(scores, minlength=MAX_ROLL + 1) / samples
+    return {score: float(probabilities[score]) for score in range(MIN_ROLL, MAX_ROLL + 1)}
+
+
+def modifier_distribution(scores):
+    """
+    Distribution of modifiers from a distribution of scores
+
+    Args:
+        scores (dict): score to probability
+
+    Returns:
+        dict: modifier to probability
+    """
+    result = {}
+    for score, probability in scores.items():
+        modifier = int(modifiers(score))
+        result[modifier] = result.get(modifier, 0.0) + probability
+    return result
+
+
+def set_total_distribution(method='4d6', sets=1, samples=100000, rng=None):
+    """
+    Monte Carlo distribution of the total of the best of some sets, the number
+    "roll N sets, pick the best" tables are judged by
+
+    Args:
+        sets (int): sets rolled to pick the best from
+        samples (int): best-of picks to simulate
+
+    Returns:
+        dict: total to probability, only totals that came up
+    """
+    best = roll_best_of(samples, sets, method=method, rng=rng)
+    totals = best.sum(axis=-1, dtype=np.int16)
+    counts = np.bincount(totals)
+    return {int(total): float(count / samples) for total, count in enumerate(counts) if count}
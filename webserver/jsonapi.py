@@ -0,0 +1,199 @@
+"""
+Contains the helpers behind the /api/v1 JSON routes: turning characters into JSON objects, picking the
+fields a client asked for, and sending responses with ETags so unchanged data costs a 304
+"""
+import json
+import hashlib
+from flask import request, make_response
+import derivedstats
+from rules import get_rules
+
+try:
+    import orjson
+except ImportError:
+    # Falls back to the standard library encoder, just slower
+    orjson = None
+
+API_VERSION = 1
+
+# Largest ID a BIGINT column holds; bigger ones make the database driver raise instead of finding nothing
+MAX_ID = 2**63 - 1
+
+# Fields a client can ask for with ?fields=, in the order they appear in each character object
+CHARACTER_FIELDS = (
+    'id', 'name', 'username', 'race', 'class', 'background',
+    'ability_scores', 'proficiency_bonus', 'saving_throws', 'skills',
+)
+
+
+def dumps(data):
+    """
+    Encodes data as compact JSON
+
+    Returns:
+        bytes: UTF-8 JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def parse_fields(text, allowed=CHARACTER_FIELDS):
+    """
+    Reads a comma separated ?fields= list
+
+    Args:
+        text (str): the argument, or None for every field
+
+    Returns:
+        tuple: chosen fields in allowed order
+
+    Raises:
+        ValueError: if a field isn't in allowed
+    """
+    if not text:
+        return allowed
+    wanted = {field.strip() for field in text.split(',') if field.strip()}
+    unknown = wanted.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(field for field in allowed if field in wanted)
+
+
+def parse_ids(text, limit):
+    """
+    Reads a comma separated ?ids= list
+
+    Args:
+        text (str): the argument
+        limit (int): most IDs allowed
+
+    Returns:
+        list: IDs without repeats, in the order given
+
+    Raises:
+        ValueError: if an ID isn't a whole number from 1 to MAX_ID or there are more than limit
+    """
+    ids = {}
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if not item.isdigit() or not 1 <= int(item) <= MAX_ID:
+            raise ValueError(f"{item} is not a character ID")
+        ids[int(item)] = None
+    if not ids:
+        raise ValueError("Give at least one character ID")
+    if len(ids) > limit:
+        raise ValueError(f"At most {limit} IDs at once")
+    return list(ids)
+
+
+def _saving_throws(character):
+    return [
+        {'name': throw.name, 'modifier': throw.modifier, 'proficient': throw.proficient}
+        for throw in derivedstats.saving_throws(character)
+    ]
+
+
+def _skills(character):
+    return [
+        {'name': skill.name, 'modifier': skill.modifier, 'proficient': skill.proficient, 'expert': skill.expert}
+        for skill in derivedstats.skills(character)
+    ]
+
+
+def _background(character):
+    if character.background_id is None:
+        return None
+    return {'id': character.background_id, 'name': character.background_name}
+
+
+# How each field is read off a Character. Saving throws and skills are only derived when asked for.
+_CHARACTER_VALUES = {
+    'id': lambda character: character.id,
+    'name': lambda character: character.name,
+    'username': lambda character: character.username,
+    'race': lambda character: {'id': character.race_id, 'name': character.race_name},
+    'class': lambda character: {'id': character.class_id, 'name': character.class_name},
+    'background': _background,
+    'ability_scores': lambda character: dict(zip(get_rules().abilities, character.ability_scores)),
+    'proficiency_bonus': lambda character: character.proficiency_bonus,
+    'saving_throws': _saving_throws,
+    'skills': _skills,
+}
+
+
+def character_object(character, fields=CHARACTER_FIELDS):
+    """
+    JSON object of a character with only the chosen fields
+
+    Args:
+        character (Character): loaded character
+        fields (tuple): fields from CHARACTER_FIELDS
+
+    Returns:
+        dict: JSON ready character
+    """
+    return {field: _CHARACTER_VALUES[field](character) for field in fields}
+
+
+def reference_object(rows):
+    """
+    JSON objects of the rows of a cached reference table
+
+    Args:
+        rows (list): (Name, Page_Number, ID) rows
+
+    Returns:
+        list: objects with id, name and page
+    """
+    return [{'id': row[2], 'name': row[0], 'page': row[1]} for row in rows]
+
+
+def etag_of(body):
+    """
+    Strong ETag of a response body
+    """
+    return hashlib.sha1(body).hexdigest()
+
+
+def response(data=None, body=None, etag=None, max_age=None, status=200):
+    """
+    Builds a JSON response that answers If-None-Match with a 304
+
+    Args:
+        data: anything dumps() can encode, unless body is given
+        body (bytes): already encoded JSON, for responses cached between requests
+        etag (str): ETag of body, computed from the body if None
+        max_age (int): seconds shared caches may reuse the response without asking, or None
+            to keep it private and have clients revalidate every time
+
+    Returns:
+        flask.Response: response ready to return from a route
+    """
+    if body is None:
+        body = dumps(data)
+    result = make_response(body, status)
+    result.mimetype = 'application/json'
+    if status != 200:
+        return result
+    result.set_etag(etag or etag_of(body))
+    if max_age is None:
+        result.cache_control.private = True
+        result.cache_control.no_cache = True
+    else:
+        result.cache_control.public = True
+        result.cache_control.max_age = max_age
+    return result.make_conditional(request)
+
+
+def error(status, message):
+    """
+    JSON error response
+
+    Args:
+        status (int): HTTP status code
+        message (str): what went wrong
+    """
+    return response({'error': message}, status=status)
@@ -6,27 +6,155 @@ Returns:
 """
 import os
 import time
-import json
+import hmac
+import hashlib
+import logging
 import pyotp
-from flask import Flask, session, render_template, request, redirect, url_for, flash, get_flashed_messages
+from flask import Flask, session, g, render_template, make_response, request, redirect, url_for, abort, flash, get_flashed_messages
 from flask_qrcode import QRcode
 from flask_bootstrap import Bootstrap
-from dbutilities import is_user, get_password_hash, change_password_hash, create_user, delete_user, totp_enabled, add_totp, get_totp_seed, get_table_contents, add_character, add_saving_throw, add_skill, get_user_characters, get_race_name, get_class_name, get_background_name, get_one_character, get_saving_throws, get_skills, get_user_party_id, get_parties, update_user_party_id, add_party, get_character_name, delete_character
-from serverutilities import hash_password, correct_password, user_authenticated, calculate_modifier
+from dbutilities import change_password_hash, create_user, delete_user, add_totp, get_table_contents, add_character_with_details, get_user_character_summaries, get_parties, update_user_party_id, add_party, get_character_name, delete_character, get_pool_stats, update_character_with_details, get_user_credentials, get_reference_generation, get_character_sheet, get_party_name, get_party_roster, get_characters, get_reference_table
+from serverutilities import hash_password, correct_password, needs_rehash, user_authenticated, PasswordHashingBusy
+from rules import get_rules, enable_reload
+import derivedstats
+import dice
+import partyodds
+import jsonapi
+from throttle import LoginThrottle
+from sheetcache import SheetCache
+import metrics
+from profiler import RequestProfiler
 from dotenv import load_dotenv
 
-#used for loading json
-SCRIPT_PATH = __file__
-
 # Load environment variables from .env file to get secret
 load_dotenv()
 
+# Structured key=value logs at log_level
+logging.basicConfig(level=os.getenv('log_level', 'INFO'), format='%(asctime)s level=%(levelname)s logger=%(name)s %(message)s')
+
 # Initialize the flask app
 app = Flask(__name__)
 app.secret_key = os.getenv("secret")
 QRcode(app)
 Bootstrap(app)
 
+# Load skills and saving throws once. Set rules_reload=true to pick up edits to the JSON while developing
+enable_reload(os.getenv('rules_reload', 'false').lower() == 'true')
+get_rules()
+
+# Failed logins and password resets allowed before further attempts are refused
+login_throttle = LoginThrottle(
+    user_limit=int(os.getenv('throttle_user_limit', '5')),
+    address_limit=int(os.getenv('throttle_address_limit', '20')),
+    window=float(os.getenv('throttle_window', '300')),
+    max_keys=int(os.getenv('throttle_max_keys', '10000'))
+)
+
+# Default page sizes for the character grid and party directory
+CHARACTER_PAGE_SIZE = int(os.getenv('character_page_size', '24'))
+PARTY_PAGE_SIZE = int(os.getenv('party_page_size', '50'))
+
+# Limits on the dice endpoints, so one request can't keep a worker busy
+DICE_MAX_PLAYERS = int(os.getenv('dice_max_players', '20'))
+DICE_MAX_SETS = int(os.getenv('dice_max_sets', '1000'))
+DICE_MAX_SAMPLES = int(os.getenv('dice_max_samples', '1000000'))
+
+# Most DCs the party odds page works out at once
+PARTY_ODDS_MAX_DCS = int(os.getenv('party_odds_max_dcs', '30'))
+
+# Most characters one /api/v1/characters?ids= request can fetch
+API_MAX_IDS = int(os.getenv('api_max_ids', '100'))
+
+# Rendered character sheets, dropped whenever a character is created, edited or deleted
+sheet_cache = SheetCache(max_size=int(os.getenv('sheet_cache_size', '256')))
+
+# Token /metrics and /status/* want in an "Authorization: Bearer" header. Left empty, they only answer
+# requests from this machine; behind a reverse proxy every request looks local, so set a token or firewall them.
+STATUS_TOKEN = os.getenv('status_token', '')
+
+# Profiles requests carrying a profile_tokens value in the profile_header, or a profile_sample_rate share of all
+# requests. With neither set no hooks are registered at all.
+RequestProfiler.from_env().init_app(app)
+
+def proficiency_masks():
+    """
+    Reads the proficiency checkboxes of the submitted character form
+
+    Returns:
+        Tuple (saving throw proficiencies, skill proficiencies, skill expertise) bitmasks
+    """
+    rules = get_rules()
+    throws = [throw for throw in rules.saving_throws if request.form.get(f"{throw}-proficiency") == 'true']
+    experts = [skill for skill in rules.skills if request.form.get(f"{skill}-expertise") == 'true']
+    # Expertise implies proficiency
+    skills = [skill for skill in rules.skills if request.form.get(f"{skill}-proficiency") == 'true' or skill in experts]
+    return derivedstats.to_mask(throws, rules.ability_index), derivedstats.to_mask(skills, rules.skill_index), derivedstats.to_mask(experts, rules.skill_index)
+
+@app.before_request
+def start_request_metrics():
+    """
+    Starts timing the request and counting its database work
+    """
+    g.request_start = time.perf_counter()
+    metrics.begin_request()
+
+@app.after_request
+def note_response_status(response):
+    """
+    Remembers the status code for the request metrics
+    """
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    """
+    Records latency and database work for the request, even if it failed
+    """
+    if 'request_start' not in g:
+        return
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    status = g.get('response_status', 500)
+    metrics.end_request(route, request.method, status, time.perf_counter() - g.request_start)
+
+def user_context(username):
+    """
+    Gets the credentials of a user, fetched at most once per request
+
+    Returns:
+        UserCredentials: or None if there is no such user
+    """
+    contexts = g.setdefault('user_contexts', {})
+    if username not in contexts:
+        contexts[username] = get_user_credentials(username)
+    return contexts[username]
+
+def forget_user_context(username):
+    """
+    Drops the per-request credentials of a user after they were changed
+    """
+    g.setdefault('user_contexts', {}).pop(username, None)
+
+def session_user_context():
+    """
+    Gets the credentials of the logged in user, logging the session out if the account is gone
+
+    Returns:
+        UserCredentials: or None if the session has no existing user
+    """
+    credentials = user_context(session['username']) if 'username' in session else None
+    if credentials is None:
+        session['authenticated'] = False
+        session.pop('username', None)
+    return credentials
+
+@app.errorhandler(PasswordHashingBusy)
+def password_hashing_busy(error):
+    """
+    Tells the user to retry when too many password checks are queued
+    """
+    return "Too many logins in progress, please try again in a moment", 503
+
 @app.route("/")
 def index():
     """
@@ -48,13 +176,24 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         entered_password = request.form['password']
-        if is_user(username):
-            if correct_password(get_password_hash(username), entered_password):
+        if not login_throttle.allowed(username, request.remote_addr):
+            error = "Too many failed attempts, please try again later"
+            return render_template('login.html', error=error), 429
+        credentials = user_context(username)
+        if credentials is not None:
+            if correct_password(credentials.password_hash, entered_password):
+                login_throttle.record_success(username)
+                # Upgrade hashes made with an old work factor while we have the password
+                if needs_rehash(credentials.password_hash):
+                    change_password_hash(username, hash_password(entered_password))
+                    forget_user_context(username)
                 session['authenticated'] = True
                 session['username'] = username
                 return redirect(url_for('verify_totp'))
+            login_throttle.record_failure(username, request.remote_addr)
             error = "Entered password was wrong"
             return render_template('login.html', error=error)
+        login_throttle.record_failure(username, request.remote_addr)
         error = "Username not found"
         return render_template('login.html', error=error)
     return render_template('login.html')
@@ -73,14 +212,17 @@ def verify_totp():
     """
     Return user to login page if wrong totp code
     """
-    if totp_enabled(session['username']):
+    credentials = session_user_context()
+    if credentials is None:
+        return redirect(url_for('login'))
+    if credentials.totp_enabled:
         session['authenticated'] = False
         render_template('verify-totp.html')
     else:
         return redirect(url_for('characters'))
     if request.method == 'POST':
         totp_code = request.form['totp-code']
-        totp_seed = get_totp_seed(session['username'])
+        totp_seed = credentials.totp_seed
         totp_validate = pyotp.totp.TOTP(totp_seed)
         if totp_code != totp_validate.now():
             flash("TOTP code was invalid")
@@ -114,15 +256,23 @@ def reset_password():
     if request.method == 'POST':
         username = request.form['username']
         totp_code = request.form['totp-code']
+        if not login_throttle.allowed(username, request.remote_addr):
+            flash("Too many failed attempts, please try again later")
+            return redirect(url_for('login'))
         # verify the totp code
-        totp_seed = get_totp_seed(username)
-        totp_validate = pyotp.totp.TOTP(totp_seed)
+        credentials = user_context(username)
+        if credentials is None or not credentials.totp_enabled:
+            login_throttle.record_failure(username, request.remote_addr)
+            return redirect(url_for('login'))
+        totp_validate = pyotp.totp.TOTP(credentials.totp_seed)
         if totp_code != totp_validate.now():
+            login_throttle.record_failure(username, request.remote_addr)
             return redirect(url_for('login'))
         # encrypt the new password
         new_password_hash = hash_password(request.form['new-password'])
         # update the password for the user
         change_password_hash(username, new_password_hash)
+        forget_user_context(username)
         return redirect(url_for('login'))
     return render_template('reset-password.html')
 
@@ -169,7 +319,10 @@ def change_password():
         confirm_new_password = request.form['confirm-new-password']
 
         # Get what the correct password should be
-        hashed_password = get_password_hash(username)
+        credentials = session_user_context()
+        if credentials is None:
+            return redirect(url_for('login'))
+        hashed_password = credentials.password_hash
 
         # Check if form data meets criteria
         if not correct_password(hashed_password, old_password):
@@ -186,6 +339,7 @@ def change_password():
         else:
             new_password_hash = hash_password(new_password)
             password_changed = change_password_hash(username, new_password_hash)
+            forget_user_context(username)
             if password_changed:
                 return redirect(url_for('account_page'))
             error = "Something went wrong changing your password"
@@ -197,8 +351,11 @@ def totp_page():
     """
     Lets user set up totp so they can reset their password
     """
+    credentials = session_user_context()
+    if credentials is None:
+        return redirect(url_for('login'))
     # No need to set up TOTP if it's already set up
-    if totp_enabled(session['username']):
+    if credentials.totp_enabled:
         flash('Your account already has totp enabled')
         return redirect(url_for('account_page'))
 
@@ -228,10 +385,68 @@ def party_page():
     """
     if not user_authenticated():
         return redirect(url_for('login'))
-    user = session['username']
-    partyID = get_user_party_id(user)
-    party_list = get_parties()
-    return render_template('party.html', party_list=party_list, partyID=partyID)
+    credentials = session_user_context()
+    if credentials is None:
+        return redirect(url_for('login'))
+    partyID = credentials.party_id
+    party_name = get_party_name(partyID)
+    return render_template('party.html', party_name=party_name, partyID=partyID)
+
+@app.route("/party/roster")
+def party_roster():
+    """
+    Page listing every member of the user's party and the characters they play
+    """
+    if not user_authenticated():
+        return redirect(url_for('login'))
+    credentials = session_user_context()
+    if credentials is None:
+        return redirect(url_for('login'))
+    party_id = credentials.party_id
+    if party_id is None:
+        flash("Join a party to see its roster")
+        return redirect(url_for('party_page'))
+
+    # Group the roster by member, keeping query order
+    members = {}
+    for username, character in get_party_roster(party_id):
+        characters = members.setdefault(username, [])
+        if character is not None:
+            characters.append(character)
+    return render_template('party-roster.html', page_title='Party Roster', active_page='party', party_name=get_party_name(party_id), members=members, abilities=get_rules().abilities)
+
+@app.route("/party/odds")
+def party_odds():
+    """
+    Page showing every party character's chance of passing each saving throw and skill check
+    Query arguments: dc, a comma separated list of DCs and ranges like 10-20, and mode (normal, advantage or disadvantage)
+    """
+    if not user_authenticated():
+        return redirect(url_for('login'))
+    credentials = session_user_context()
+    if credentials is None:
+        return redirect(url_for('login'))
+    party_id = credentials.party_id
+    if party_id is None:
+        flash("Join a party to see its odds")
+        return redirect(url_for('party_page'))
+
+    dc_text = request.args.get('dc', '10,15,20')
+    mode = request.args.get('mode', 'normal')
+    if mode not in partyodds.ROLL_MODES:
+        abort(400)
+    try:
+        dcs = partyodds.parse_dcs(dc_text, PARTY_ODDS_MAX_DCS)
+    except ValueError as error:
+        flash(str(error))
+        dcs = []
+
+    characters = [character for _, character in get_party_roster(party_id) if character is not None]
+    members, anyone = partyodds.party_odds(characters, dcs, mode) if dcs else ([], [])
+    saving_throws, skills = partyodds.check_names()
+    return render_template('party-odds.html', page_title='Party Odds', active_page='party', party_name=get_party_name(party_id),
+                           characters=characters, members=members, anyone=anyone, dcs=dcs, dc_text=dc_text, mode=mode,
+                           modes=partyodds.ROLL_MODES, saving_throws=saving_throws, skills=skills)
 
 @app.route("/party/create", methods=['GET', 'POST'])
 def create_party():
@@ -259,8 +474,14 @@ def join_party():
         update_user_party_id(party_id, session['username'])
         return redirect(url_for('party_page'))
 
-    party_list = get_parties()
-    return render_template('join-party.html', party_list=party_list)
+    name_filter = request.args.get('name', '').strip()
+    party_list = get_parties(
+        after=request.args.get('after', type=int),
+        before=request.args.get('before', type=int),
+        page_size=request.args.get('size', PARTY_PAGE_SIZE, type=int),
+        name_prefix=name_filter
+    )
+    return render_template('join-party.html', party_list=party_list, name_filter=name_filter)
 
 @app.route("/characters", methods=['GET'])
 def characters():
@@ -275,16 +496,13 @@ def characters():
     if not user_authenticated():
         return redirect(url_for('login'))
     if request.method == 'GET':
-        character_list = get_user_characters(session['username'])
-        result = []
-        for character in character_list:
-            character_name = character[0]
-            race_name = get_race_name(character[1])
-            class_name = get_class_name(character[2])
-            background_name = get_background_name(character[3])
-            character_id = character[4]
-            result.append((character_name, race_name, class_name, background_name, character_id))
-        return render_template('character.html', character_list=result)
+        character_list = get_user_character_summaries(
+            session['username'],
+            after=request.args.get('after', type=int),
+            before=request.args.get('before', type=int),
+            page_size=request.args.get('size', CHARACTER_PAGE_SIZE, type=int)
+        )
+        return render_template('character.html', character_list=character_list)
 
 
 @app.route("/characters/show/<int:character_id>")
@@ -294,16 +512,16 @@ def get_character_details(character_id):
     """
     if not user_authenticated():
         return redirect(url_for('login'))
-    character = get_one_character(character_id)
-    character_name = character[1]
-    ability_scores = character[2:8]
-    prof_bon = character[8]
-    race_name = get_race_name(character[11])
-    class_name = get_class_name(character[12])
-    background_name = get_background_name(character[10])
-    saving_throws = get_saving_throws(character_id)
-    skills = get_skills(character_id)
-    return render_template('show-character.html', character_name=character_name,character_race=race_name,character_class=class_name,character_background=background_name,prof_bon=prof_bon, ability_scores=ability_scores,saving_throws=saving_throws, skills=skills)
+    cache_key = sheet_cache.key(character_id, get_reference_generation())
+    html = sheet_cache.get(cache_key)
+    if html is not None:
+        return html
+    character = get_character_sheet(character_id)
+    if character is None:
+        abort(404)
+    html = render_template('show-character.html', character=character, saving_throws=derivedstats.saving_throws(character), skills=derivedstats.skills(character))
+    sheet_cache.put(cache_key, html)
+    return html
 
 @app.route("/characters/create", methods=['GET', 'POST'])
 def create_character():
@@ -313,16 +531,10 @@ def create_character():
     if not user_authenticated():
         return redirect(url_for('login'))
 
-    # Get path to JSON
-    data_path = os.path.dirname(os.path.dirname(SCRIPT_PATH))
-    data_path = os.path.join(data_path, 'data', 'skills-and-saving-throws.json')
-
-    # Load Skills and saving throws from JSON
-    with open(data_path, encoding="utf-8") as file:
-        loaded_json = json.load(file)
-    abilities = loaded_json['Saving throws']
-    skills = loaded_json['Skills']
-    saving_throws = loaded_json['Saving throws']
+    rules = get_rules()
+    abilities = rules.abilities
+    skills = rules.skills
+    saving_throws = rules.saving_throws
 
     if request.method == 'POST':
         # Gather data needed to create character
@@ -334,27 +546,9 @@ def create_character():
         ability_scores = []
         for ability in abilities:
             ability_scores.append(request.form[ability])
-        character_id = add_character(character_name, character_race, character_class, character_background, ability_scores, character_proficiency_bonus, session['username'])
-
-        for throw in saving_throws:
-            # Determine if proficiency
-            proficiency_key = f"{throw}-proficiency"
-            proficiency = request.form.get(proficiency_key) == 'true'
-            ability_score = int(request.form[throw])
-            if proficiency:
-                modifier = calculate_modifier(ability_score) + character_proficiency_bonus
-            modifier = calculate_modifier(ability_score)
-            add_saving_throw(character_id, throw, modifier, proficiency)
-
-        for skill, ability_score in skills.items():
-            # Determine if proficiency
-            proficiency_key = f"{skill}-proficiency"
-            proficiency = request.form.get(proficiency_key) == 'true'
-            ability_score = int(request.form[ability_score])
-            if proficiency:
-                modifier = calculate_modifier(ability_score) + character_proficiency_bonus
-            modifier = calculate_modifier(ability_score)
-            add_skill(character_id, skill, modifier, proficiency)
+        throw_mask, skill_mask, expertise_mask = proficiency_masks()
+        character_id = add_character_with_details(character_name, character_race, character_class, character_background, ability_scores, character_proficiency_bonus, session['username'], throw_mask, skill_mask, expertise_mask)
+        sheet_cache.invalidate(character_id)
         return redirect(url_for('characters'))
     races = get_table_contents('Race')
     classes = get_table_contents('Class')
@@ -366,63 +560,40 @@ def edit_character_details(character_id):
     """
     Page to edit details for a particular character
     """
-    character = get_one_character(character_id)
-    character_name = character[1]
-    ability_scores = character[2:8]
-    prof_bon = character[8]
-    race_id = character[11]
-    class_id = character[12]
-    background_id = character[10]
-    saving_throws = get_saving_throws(character_id)
-    skills = get_skills(character_id)
-    races = get_table_contents('Race')
-    classes = get_table_contents('Class')
-    backgrounds = get_table_contents('Background')    
+    character = get_character_sheet(character_id)
+    if character is None:
+        abort(404)
 
     if request.method == 'POST':
-    # Get path to JSON
-        data_path = os.path.dirname(os.path.dirname(SCRIPT_PATH))
-        data_path = os.path.join(data_path, 'data', 'skills-and-saving-throws.json')
-        # Load Skills and saving throws from JSON
-        with open(data_path, encoding="utf-8") as file:
-            loaded_json = json.load(file)
-        abilities = loaded_json['Saving throws']
-        skills = loaded_json['Skills']
-        saving_throws = loaded_json['Saving throws']
-        # Delete the old character
-        delete_character(character_id)
-        # Gather data needed to create character
-        character_name = request.form['name']
-        character_race = request.form['race']
-        character_class = request.form['class']
-        character_background = request.form['background']
+        rules = get_rules()
+        abilities = rules.abilities
+
+        # What is stored right now
+        stored = character.column_values()
+
+        # What was submitted
         character_proficiency_bonus = int(request.form['proficiency-bonus'])
-        ability_scores = []
+        submitted = {
+            'CharacterName': request.form['name'],
+            'Proficiency_bonus': character_proficiency_bonus,
+            'BackgroundID': int(request.form['background']),
+            'RaceID': int(request.form['race']),
+            'ClassID': int(request.form['class']),
+        }
         for ability in abilities:
-            ability_scores.append(request.form[ability])
-        character_id = add_character(character_name, character_race, character_class, character_background, ability_scores, character_proficiency_bonus, session['username'])
-
-        for throw in saving_throws:
-            # Determine if proficiency
-            proficiency_key = f"{throw}-proficiency"
-            proficiency = request.form.get(proficiency_key) == 'true'
-            ability_score = int(request.form[throw])
-            if proficiency:
-                modifier = calculate_modifier(ability_score) + character_proficiency_bonus
-            modifier = calculate_modifier(ability_score)
-            add_saving_throw(character_id, throw, modifier, proficiency)
-
-        for skill, ability_score in skills.items():
-            # Determine if proficiency
-            proficiency_key = f"{skill}-proficiency"
-            proficiency = request.form.get(proficiency_key) == 'true'
-            ability_score = int(request.form[ability_score])
-            if proficiency:
-                modifier = calculate_modifier(ability_score) + character_proficiency_bonus
-            modifier = calculate_modifier(ability_score)
-            add_skill(character_id, skill, modifier, proficiency)
+            submitted[f"{ability}_Ability_Score"] = int(request.form[ability])
+        submitted.update(zip(('Saving_Throw_Proficiencies', 'Skill_Proficiencies', 'Skill_Expertise'), proficiency_masks()))
+
+        # Only write what changed
+        changes = {column: value for column, value in submitted.items() if stored[column] != value}
+        update_character_with_details(character_id, changes)
+        sheet_cache.invalidate(character_id)
         return redirect(url_for('characters'))
-    return render_template('edit-character.html', races=races, classes=classes, backgrounds=backgrounds, name=character_name, race_id=race_id, class_id=class_id, background_id=background_id, saving_throws=saving_throws, skills=skills, prof_bon=prof_bon, ability_scores=ability_scores)
+    races = get_table_contents('Race')
+    classes = get_table_contents('Class')
+    backgrounds = get_table_contents('Background')
+    # Saving throws come in ability order, so they line up with character.ability_scores in the form
+    return render_template('edit-character.html', races=races, classes=classes, backgrounds=backgrounds, character=character, saving_throws=derivedstats.saving_throws(character), skills=derivedstats.skills(character))
 
 @app.route("/characters/delete/<int:character_id>", methods=['GET', 'POST'])
 def character_deletion_page(character_id):
@@ -433,40 +604,328 @@ def character_deletion_page(character_id):
         confirmation = request.form.get('confirmation')
         if confirmation == 'yes':
             delete_character(character_id)
+            sheet_cache.invalidate(character_id)
         return redirect(url_for('characters'))
     char_name = get_character_name(character_id)
     return render_template('delete-character.html', char_name=char_name)
 
+# Rendered reference pages: template -> (reference generation, html, etag, last modified)
+reference_pages = {}
+REFERENCE_MAX_AGE = int(os.getenv('reference_max_age', '300'))
+
+def reference_page(template, **tables):
+    """
+    Renders a reference page once per version of the reference data and serves it
+    with ETag, Last-Modified and Cache-Control so browsers can revalidate cheaply
+
+    Args:
+        template (str): template to render
+        tables: template variable name to reference table name
+    """
+    generation = get_reference_generation()
+    page = reference_pages.get(template)
+    if page is None or page[0] != generation:
+        html = render_template(template, **{name: get_table_contents(table) for name, table in tables.items()})
+        etag = hashlib.sha1(html.encode('utf-8')).hexdigest()
+        # Keep the old timestamp if the page didn't actually change
+        last_modified = page[3] if page is not None and page[2] == etag else int(time.time())
+        page = (generation, html, etag, last_modified)
+        reference_pages[template] = page
+    _, html, etag, last_modified = page
+
+    response = make_response(html)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = REFERENCE_MAX_AGE
+    return response.make_conditional(request)
+
 @app.route("/reference")
 def ref():
     """
     Contains pointers to each different reference page
     """
-    return render_template('ref.html')
+    return reference_page('ref.html')
 
 @app.route("/reference/races")
 def race_ref():
     """
     Page containing table showing page number in the PHB for each race
     """
-    races = get_table_contents('Race')
-    return render_template('race-ref.html', races=races)
+    return reference_page('race-ref.html', races='Race')
 
 @app.route("/reference/classes")
 def class_ref():
     """
     Page containing table showing page number in the PHB for each class
     """
-    classes = get_table_contents('Class')
-    return render_template('class-ref.html', classes=classes)
+    return reference_page('class-ref.html', classes='Class')
 
 @app.route("/reference/backgrounds")
 def background_ref():
     """
     Page containing table showing page number in the PHB for each background
     """
-    backgrounds = get_table_contents('Background')
-    return render_template('background-ref.html', backgrounds=backgrounds)
+    return reference_page('background-ref.html', backgrounds='Background')
+
+@app.route("/dice/roll")
+def roll_ability_scores():
+    """
+    Rolls ability scores as JSON for the create character form
+    Query arguments: method (4d6, 3d6 or standard), players, and sets rolled per player of which the best is kept
+    """
+    if not user_authenticated():
+        abort(401)
+    method = request.args.get('method', '4d6')
+    players = request.args.get('players', 1, type=int)
+    sets = request.args.get('sets', 1, type=int)
+    if not 1 <= players <= DICE_MAX_PLAYERS or not 1 <= sets <= DICE_MAX_SETS:
+        abort(400)
+    if method == 'standard':
+        scores = dice.standard_arrays(players)
+    elif method in dice.ROLL_METHODS:
+        scores = dice.roll_best_of(players, sets, method=method)
+    else:
+        abort(400)
+    return {
+        'method': method,
+        'abilities': list(get_rules().abilities),
+        'scores': scores.tolist(),
+        'modifiers': dice.modifiers(scores).tolist(),
+        'totals': scores.sum(axis=-1).tolist(),
+    }
+
+@app.route("/dice/point-buy")
+def check_point_buy():
+    """
+    Checks a comma separated list of scores against the point-buy rules as JSON
+    """
+    if not user_authenticated():
+        abort(401)
+    try:
+        scores = [int(score) for score in request.args.get('scores', '').split(',')]
+    except ValueError:
+        abort(400)
+    if len(scores) != dice.ABILITY_COUNT:
+        abort(400)
+    if not all(dice.MIN_SCORE <= score <= dice.MAX_SCORE for score in scores):
+        abort(400)
+    cost = int(dice.point_buy_cost(scores))
+    return {
+        'scores': scores,
+        'cost': cost if cost >= 0 else None,
+        'budget': dice.POINT_BUY_BUDGET,
+        'valid': bool(dice.valid_point_buy(scores)),
+    }
+
+@app.route("/dice/distribution")
+def ability_score_distribution():
+    """
+    Distribution of one ability score and its modifier as JSON, exact unless samples is given
+    With sets above 1 it is the Monte Carlo distribution of the total of the best of that many sets instead
+    """
+    if not user_authenticated():
+        abort(401)
+    method = request.args.get('method', '4d6')
+    samples = request.args.get('samples', type=int)
+    sets = request.args.get('sets', 1, type=int)
+    if method not in dice.ROLL_METHODS or not 1 <= sets <= DICE_MAX_SETS:
+        abort(400)
+    if samples is not None and not 1 <= samples <= DICE_MAX_SAMPLES:
+        abort(400)
+    if sets > 1:
+        samples = min(samples or 100000, DICE_MAX_SAMPLES // sets)
+        return {'method': method, 'sets': sets, 'samples': samples, 'totals': dice.set_total_distribution(method, sets, samples)}
+    scores = dice.score_distribution(method, samples)
+    return {'method': method, 'exact': samples is None, 'scores': scores, 'modifiers': dice.modifier_distribution(scores)}
+
+API_PREFIX = f"/api/v{jsonapi.API_VERSION}"
+
+@app.route(f"{API_PREFIX}/characters")
+def api_characters():
+    """
+    Characters as JSON
+    With ids, a comma separated list of character IDs, fetches those of them owned by the user or their
+    party in one query and lists the rest under missing. Without it, a page of the user's own characters,
+    paged with after, before and size like /characters.
+    fields picks which character fields to send, see jsonapi.CHARACTER_FIELDS
+    """
+    if not user_authenticated():
+        return jsonapi.error(401, "Log in first")
+    try:
+        fields = jsonapi.parse_fields(request.args.get('fields'))
+        ids = request.args.get('ids')
+        if ids is not None:
+            ids = jsonapi.parse_ids(ids, API_MAX_IDS)
+    except ValueError as error:
+        return jsonapi.error(400, str(error))
+
+    if ids is not None:
+        found = get_characters(ids, session['username'])
+        found_ids = {character.id for character in found}
+        return jsonapi.response({
+            'characters': [jsonapi.character_object(character, fields) for character in found],
+            'missing': [character_id for character_id in ids if character_id not in found_ids],
+        })
+
+    page = get_user_character_summaries(
+        session['username'],
+        after=request.args.get('after', type=int),
+        before=request.args.get('before', type=int),
+        page_size=request.args.get('size', CHARACTER_PAGE_SIZE, type=int)
+    )
+    return jsonapi.response({
+        'characters': [jsonapi.character_object(character, fields) for character in page],
+        'next': page.next_cursor,
+        'prev': page.prev_cursor,
+    })
+
+@app.route(f"{API_PREFIX}/characters/<int:character_id>")
+def api_character(character_id):
+    """
+    One of the user's or their party's characters as JSON, with the same fields argument as api_characters
+    """
+    if not user_authenticated():
+        return jsonapi.error(401, "Log in first")
+    try:
+        fields = jsonapi.parse_fields(request.args.get('fields'))
+    except ValueError as error:
+        return jsonapi.error(400, str(error))
+    found = get_characters([character_id], session['username']) if character_id <= jsonapi.MAX_ID else []
+    if not found:
+        return jsonapi.error(404, "No such character")
+    return jsonapi.response(jsonapi.character_object(found[0], fields))
+
+@app.route(f"{API_PREFIX}/party")
+def api_party():
+    """
+    The user's party and every member's characters as JSON, from the same single query as /party/roster
+    fields picks which character fields to send
+    """
+    if not user_authenticated():
+        return jsonapi.error(401, "Log in first")
+    try:
+        fields = jsonapi.parse_fields(request.args.get('fields'))
+    except ValueError as error:
+        return jsonapi.error(400, str(error))
+    credentials = session_user_context()
+    if credentials is None:
+        return jsonapi.error(401, "Log in first")
+    party_id = credentials.party_id
+    if party_id is None:
+        return jsonapi.error(404, "Not a member of a party")
+
+    members = {}
+    for username, character in get_party_roster(party_id):
+        characters = members.setdefault(username, [])
+        if character is not None:
+            characters.append(jsonapi.character_object(character, fields))
+    return jsonapi.response({
+        'id': party_id,
+        'name': get_party_name(party_id),
+        'members': [{'username': username, 'characters': characters} for username, characters in members.items()],
+    })
+
+# Reference data as JSON: section -> (reference generation, rules, body, etag)
+api_reference_bodies = {}
+API_REFERENCE_SECTIONS = {'races': 'Race', 'classes': 'Class', 'backgrounds': 'Background', 'rules': None}
+
+def api_reference_body(section):
+    """
+    Encodes a section of the reference data, or all of it when section is None, once per version of the data
+
+    Returns:
+        tuple: (body, etag)
+    """
+    generation = get_reference_generation()
+    rules = get_rules()
+    cached = api_reference_bodies.get(section)
+    if cached is None or cached[0] != generation or cached[1] is not rules:
+        data = {}
+        for name, table in API_REFERENCE_SECTIONS.items():
+            if section is not None and name != section:
+                continue
+            if table is None:
+                data[name] = {'abilities': list(rules.abilities), 'skills': dict(rules.skills)}
+            else:
+                data[name] = jsonapi.reference_object(get_reference_table(table).rows)
+        body = jsonapi.dumps(data if section is None else data[section])
+        cached = (generation, rules, body, jsonapi.etag_of(body))
+        api_reference_bodies[section] = cached
+    return cached[2], cached[3]
+
+@app.route(f"{API_PREFIX}/reference")
+@app.route(f"{API_PREFIX}/reference/<section>")
+def api_reference(section=None):
+    """
+    Races, classes, backgrounds and the skills and saving throws rules as JSON, or one of them by name
+    Cacheable by anyone for reference_max_age seconds, like the reference pages
+    """
+    if section is not None and section not in API_REFERENCE_SECTIONS:
+        return jsonapi.error(404, "No such reference section")
+    body, etag = api_reference_body(section)
+    return jsonapi.response(body=body, etag=etag, max_age=REFERENCE_MAX_AGE)
+
+def status_allowed():
+    """
+    Whether the current request may read /metrics and the /status pages
+    """
+    if STATUS_TOKEN:
+        supplied = request.headers.get('Authorization', '')
+        return hmac.compare_digest(supplied.encode(), f"Bearer {STATUS_TOKEN}".encode())
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route("/status/db-pool")
+def db_pool_status():
+    """
+    Shows connection pool statistics as JSON
+    """
+    if not status_allowed():
+        abort(403)
+    return get_pool_stats()
+
+@app.route("/status/login-throttle")
+def login_throttle_status():
+    """
+    Shows login throttle counters as JSON
+    """
+    if not status_allowed():
+        abort(403)
+    return login_throttle.stats()
+
+@app.route("/status/sheet-cache")
+def sheet_cache_status():
+    """
+    Shows character sheet cache counters as JSON
+    """
+    if not status_allowed():
+        abort(403)
+    return sheet_cache.stats()
+
+# Stats that only ever go up, exported as counters. Every other stat is a gauge.
+COUNTER_STATS = {
+    'db_pool': {'checkouts', 'creations', 'recycled', 'failed_health_checks', 'waits', 'timeouts', 'reclaimed', 'wait_time'},
+    'sheet_cache': {'hits', 'misses', 'evictions', 'invalidations'},
+    'login_throttle': {'allowed', 'rejected', 'failures', 'evictions'},
+}
+
+@app.route("/metrics")
+def metrics_page():
+    """
+    Request latency, database counters and cache statistics in the Prometheus text format
+    """
+    if not status_allowed():
+        abort(403)
+    gauges = []
+    counters = []
+    for prefix, stats in (('db_pool', get_pool_stats()), ('sheet_cache', sheet_cache.stats()), ('login_throttle', login_throttle.stats())):
+        for key, value in stats.items():
+            documentation = f"{prefix.replace('_', ' ')} {key.replace('_', ' ')}"
+            if key in COUNTER_STATS[prefix]:
+                counters.append((f"{prefix}_{key}_total", documentation, value))
+            else:
+                gauges.append((f"{prefix}_{key}", documentation, value))
+    return metrics.render(gauges, counters), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 if __name__ == "__main__":
     app.run(port=8080, debug=True) # TODO: Students PLEASE remove debug=True when put in production
@@ -0,0 +1,258 @@
+"""
+Contains request and database instrumentation and renders it in the Prometheus text format
+"""
+import os
+import time
+import logging
+import threading
+from contextvars import ContextVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+slow_query_logger = logging.getLogger('dbutilities.slow')
+
+# Queries slower than this many milliseconds are written to the slow query log
+SLOW_QUERY_MS = float(os.getenv('slow_query_ms', '100'))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed bucket bounds, one series per label tuple
+    """
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        """
+        Records one value for the given label values
+        """
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        """
+        Lines of Prometheus text for this histogram
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (buckets, total, count) in sorted(self._series.items()):
+            label_text = _labels(self.label_names, labels)
+            for bound, bucket_count in zip(self.buckets, buckets):
+                lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + (_number(bound),))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{label_text} {_number(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Counter:
+    """
+    Monotonic counter, one series per label tuple
+    """
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._series = {}
+
+    def inc(self, labels=(), amount=1):
+        """
+        Adds amount to the series for the given label values
+        """
+        self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        """
+        Lines of Prometheus text for this counter
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+def _number(value):
+    """
+    Formats a number the way Prometheus expects
+    """
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(names, values):
+    """
+    Formats label pairs, escaping values
+    """
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+_lock = threading.Lock()
+request_latency = Histogram('http_request_duration_seconds', 'Time spent handling requests', ('route', 'method'), LATENCY_BUCKETS)
+request_queries = Histogram('http_request_db_queries', 'Database queries run per request', ('route', 'method'), COUNT_BUCKETS)
+request_connections = Histogram('http_request_db_connections', 'Connections borrowed from the pool per request', ('route', 'method'), COUNT_BUCKETS)
+request_db_time = Histogram('http_request_db_seconds', 'Time spent waiting on the database per request', ('route', 'method'), LATENCY_BUCKETS)
+requests_total = Counter('http_requests_total', 'Requests handled', ('route', 'method', 'status'))
+db_queries_total = Counter('db_queries_total', 'Database statements run')
+db_query_seconds = Histogram('db_query_duration_seconds', 'Time per database statement', (), LATENCY_BUCKETS)
+db_connections_total = Counter('db_connections_total', 'Connections borrowed from the pool')
+db_slow_queries_total = Counter('db_slow_queries_total', 'Statements slower than the slow query threshold')
+db_errors_total = Counter('db_errors_total', 'Statements that raised an error')
+
+_request_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """
+    Database work done while handling one request
+    """
+    __slots__ = ('queries', 'db_time', 'connections')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.connections = 0
+
+
+def begin_request():
+    """
+    Starts counting database work for the current request
+
+    Returns:
+        RequestStats: counters filled in as the request runs
+    """
+    stats = RequestStats()
+    _request_stats.set(stats)
+    return stats
+
+
+def end_request(route, method, status, elapsed):
+    """
+    Records a finished request and stops counting for it
+    """
+    stats = _request_stats.get()
+    _request_stats.set(None)
+    labels = (route or 'unknown', method)
+    with _lock:
+        request_latency.observe(labels, elapsed)
+        requests_total.inc(labels + (str(status),))
+        if stats is not None:
+            request_queries.observe(labels, stats.queries)
+            request_connections.observe(labels, stats.connections)
+            request_db_time.observe(labels, stats.db_time)
+    return stats
+
+
+def current_request_stats():
+    """
+    Gets the counters of the request being handled, or None outside a request
+    """
+    return _request_stats.get()
+
+
+def record_connection():
+    """
+    Counts one connection borrowed from the pool
+    """
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.connections += 1
+    with _lock:
+        db_connections_total.inc()
+
+
+def record_query(sql, elapsed, failed=False):
+    """
+    Counts one statement and writes it to the slow query log if it took too long
+    """
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+    slow = elapsed * 1000 >= SLOW_QUERY_MS
+    with _lock:
+        db_queries_total.inc()
+        db_query_seconds.observe((), elapsed)
+        if failed:
+            db_errors_total.inc()
+        if slow:
+            db_slow_queries_total.inc()
+    if slow:
+        slow_query_logger.warning("slow query duration_ms=%.1f sql=%r", elapsed * 1000, ' '.join(str(sql).split()))
+
+
+class InstrumentedCursor:
+    """
+    Cursor proxy that times every statement it runs
+    """
+    __slots__ = ('_cursor',)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, *args, **kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = self._cursor.execute(sql, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            record_query(sql, time.perf_counter() - start, failed)
+
+    def executemany(self, sql, *args, **kwargs):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = self._cursor.executemany(sql, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            record_query(sql, time.perf_counter() - start, failed)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+def render(extra_gauges=(), extra_counters=()):
+    """
+    Renders every metric in the Prometheus text format
+
+    Args:
+        extra_gauges: tuples of (name, documentation, value) sampled at scrape time
+        extra_counters: same, for values that only ever go up, like pool checkouts
+
+    Returns:
+        str: metrics page
+    """
+    lines = []
+    with _lock:
+        for metric in (requests_total, request_latency, request_queries, request_connections, request_db_time,
+                       db_queries_total, db_query_seconds, db_connections_total, db_slow_queries_total, db_errors_total):
+            lines.extend(metric.render())
+    for kind, samples in (('gauge', extra_gauges), ('counter', extra_counters)):
+        for name, documentation, value in samples:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {_number(value)}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,93 @@
+"""
+Contains the slotted records characters are loaded into, so routes and templates use names instead of row positions
+"""
+
+
+class Character:
+    """
+    One character with the names of its race, class and background
+    Built straight from a row of dbutilities.CHARACTER_FIELDS by from_row()
+    """
+    __slots__ = (
+        'id', 'name',
+        'strength', 'dexterity', 'constitution', 'intelligence', 'wisdom', 'charisma',
+        'proficiency_bonus', 'username', 'background_id', 'race_id', 'class_id',
+        'saving_throw_proficiencies', 'skill_proficiencies', 'skill_expertise',
+        'race_name', 'class_name', 'background_name',
+    )
+
+    # Characters columns and the attribute each one is loaded into, in row order
+    COLUMNS = (
+        ('ID', 'id'),
+        ('CharacterName', 'name'),
+        ('Strength_Ability_Score', 'strength'),
+        ('Dexterity_Ability_Score', 'dexterity'),
+        ('Constitution_Ability_Score', 'constitution'),
+        ('Intelligence_Ability_Score', 'intelligence'),
+        ('Wisdom_Ability_Score', 'wisdom'),
+        ('Charisma_Ability_Score', 'charisma'),
+        ('Proficiency_bonus', 'proficiency_bonus'),
+        ('username', 'username'),
+        ('BackgroundID', 'background_id'),
+        ('RaceID', 'race_id'),
+        ('ClassID', 'class_id'),
+        ('Saving_Throw_Proficiencies', 'saving_throw_proficiencies'),
+        ('Skill_Proficiencies', 'skill_proficiencies'),
+        ('Skill_Expertise', 'skill_expertise'),
+    )
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds a character from a row of COLUMNS followed by race, class and background name
+        """
+        character = cls.__new__(cls)
+        (character.id, character.name,
+         character.strength, character.dexterity, character.constitution,
+         character.intelligence, character.wisdom, character.charisma,
+         character.proficiency_bonus, character.username,
+         character.background_id, character.race_id, character.class_id,
+         character.saving_throw_proficiencies, character.skill_proficiencies, character.skill_expertise,
+         character.race_name, character.class_name, character.background_name) = row
+        return character
+
+    @property
+    def ability_scores(self):
+        """
+        Scores in ability order, Strength to Charisma
+        """
+        return (self.strength, self.dexterity, self.constitution, self.intelligence, self.wisdom, self.charisma)
+
+    def column_values(self):
+        """
+        Current value of every Characters column, keyed by column name
+        """
+        return {column: getattr(self, attribute) for column, attribute in self.COLUMNS}
+
+    def __repr__(self):
+        return f"Character(id={self.id!r}, name={self.name!r})"
+
+
+class SavingThrow:
+    """
+    A saving throw of a character, derived by derivedstats
+    """
+    __slots__ = ('name', 'modifier', 'proficient')
+
+    def __init__(self, name, modifier, proficient):
+        self.name = name
+        self.modifier = modifier
+        self.proficient = proficient
+
+
+class Skill:
+    """
+    A skill of a character, derived by derivedstats
+    """
+    __slots__ = ('name', 'modifier', 'proficient', 'expert')
+
+    def __init__(self, name, modifier, proficient, expert):
+        self.name = name
+        self.modifier = modifier
+        self.proficient = proficient
+        self.expert = expert
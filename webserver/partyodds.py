@@ -0,0 +1,157 @@
+"""
+Contains the party odds calculator: the chance of every party member passing every saving throw and
+skill check against a list of DCs, with advantage or disadvantage.
+The party is loaded into arrays once and all members, checks and DCs are worked out in one pass.
+"""
+import numpy as np
+from rules import get_rules
+
+# Rolls of the d20 are made once, twice keeping the higher, or twice keeping the lower
+ROLL_MODES = ('normal', 'advantage', 'disadvantage')
+
+# Lowest and highest DC the calculator accepts
+MIN_DC = 1
+MAX_DC = 40
+
+
+def check_names():
+    """
+    Names of every check in matrix column order, the saving throws followed by the skills
+
+    Returns:
+        tuple: (saving throw names, skill names)
+    """
+    rules = get_rules()
+    return rules.saving_throws, tuple(rules.skills)
+
+
+def check_modifiers(characters):
+    """
+    Saving throw and skill modifiers of many characters, the same as derivedstats.saving_throws and
+    derivedstats.skills give for each one of them
+
+    Args:
+        characters (list): Character records
+
+    Returns:
+        numpy.ndarray: int16 array of shape (characters, saving throws + skills)
+    """
+    rules = get_rules()
+    ability_count = len(rules.abilities)
+    skill_count = len(rules.skills)
+    skill_abilities = np.array([rules.ability_index[ability] for ability in rules.skills.values()], dtype=np.intp)
+
+    scores = np.array([character.ability_scores for character in characters], dtype=np.int16).reshape(-1, ability_count)
+    masks = np.array(
+        [(character.proficiency_bonus, character.saving_throw_proficiencies, character.skill_proficiencies, character.skill_expertise)
+         for character in characters],
+        dtype=np.int64
+    ).reshape(-1, 4)
+    bonus = masks[:, 0:1].astype(np.int16)
+
+    ability_modifiers = (scores - 10) // 2
+    save_proficient = masks[:, 1:2] >> np.arange(ability_count) & 1
+    skill_proficient = masks[:, 2:3] >> np.arange(skill_count) & 1
+    skill_expert = masks[:, 3:4] >> np.arange(skill_count) & 1
+    # Expertise doubles the proficiency bonus and counts as proficiency on its own
+    skill_multiplier = np.where(skill_expert == 1, 2, skill_proficient).astype(np.int16)
+
+    saves = ability_modifiers + bonus * save_proficient.astype(np.int16)
+    skills = ability_modifiers[:, skill_abilities] + bonus * skill_multiplier
+    return np.concatenate((saves, skills), axis=1)
+
+
+def success_probabilities(modifiers, dcs, mode='normal'):
+    """
+    Chance of meeting or beating each DC with a d20 plus each modifier
+    A natural 20 or 1 has no special effect on ability checks and saving throws.
+
+    Args:
+        modifiers: integer array of any shape
+        dcs: 1d array-like of DCs
+        mode (str): one of ROLL_MODES
+
+    Returns:
+        numpy.ndarray: float array of shape modifiers.shape + (len(dcs),)
+    """
+    if mode not in ROLL_MODES:
+        raise ValueError(f"Unknown roll mode: {mode}")
+    modifiers = np.asarray(modifiers, dtype=np.int16)[..., np.newaxis]
+    dcs = np.asarray(dcs, dtype=np.int16)
+    # Faces of the d20 that pass, out of 20
+    passing = np.clip(21 - dcs + modifiers, 0, 20) / 20
+    if mode == 'advantage':
+        return 1 - (1 - passing) ** 2
+    if mode == 'disadvantage':
+        return passing ** 2
+    return passing
+
+
+def any_success(probabilities):
+    """
+    Chance of at least one member passing, when every member of the party makes the roll
+
+    Args:
+        probabilities: array of shape (members, ...)
+
+    Returns:
+        numpy.ndarray: array of shape (...)
+    """
+    return 1 - np.prod(1 - np.asarray(probabilities), axis=0)
+
+
+def parse_dcs(text, limit):
+    """
+    Reads DCs from a comma separated list, where each item is a DC or a range like 10-20
+
+    Args:
+        text (str): DCs as typed in the form
+        limit (int): most DCs allowed
+
+    Returns:
+        list: sorted DCs without repeats
+
+    Raises:
+        ValueError: if an item isn't a DC or range, a DC is outside MIN_DC to MAX_DC, or there are more than limit
+    """
+    dcs = set()
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        low, _, high = item.partition('-')
+        try:
+            low = int(low)
+            high = int(high) if high else low
+        except ValueError:
+            raise ValueError(f"{item} is not a DC or a range of DCs") from None
+        if not MIN_DC <= low <= high <= MAX_DC:
+            raise ValueError(f"DCs have to be between {MIN_DC} and {MAX_DC}")
+        dcs.update(range(low, high + 1))
+        if len(dcs) > limit:
+            raise ValueError(f"At most {limit} DCs at once")
+    if not dcs:
+        raise ValueError("Enter at least one DC")
+    return sorted(dcs)
+
+
+def party_odds(characters, dcs, mode='normal'):
+    """
+    Odds matrix of a party, rounded to whole percentages for display
+
+    Args:
+        characters (list): Character records of the party
+        dcs (list): DCs to work out
+        mode (str): one of ROLL_MODES
+
+    Returns:
+        tuple: (members, anyone) where members is a list with one list of percentages per DC for each
+        character, shaped [character][dc][check], and anyone has the chance of at least one character
+        passing, shaped [dc][check]
+    """
+    probabilities = success_probabilities(check_modifiers(characters), dcs, mode)
+    # Checks last, so each DC is one row of the matrix
+    probabilities = probabilities.transpose(0, 2, 1)
+    members = np.rint(probabilities * 100).astype(np.int16).tolist()
+    anyone = np.rint(any_success(probabilities) * 100).astype(np.int16).tolist()
+    return members, anyone
@@ -0,0 +1,268 @@
+"""
+Contains an opt-in per-request profiler that writes collapsed stacks for flamegraphs,
+cProfile stats and tracemalloc allocation summaries
+"""
+import os
+import sys
+import hmac
+import time
+import random
+import cProfile
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from flask import g, request
+
+logger = logging.getLogger('profiler')
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread at a fixed interval and counts identical stacks
+    """
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        """
+        Starts sampling in the background
+        """
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops sampling and waits for the sampler thread to finish
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+
+    def collapsed(self):
+        """
+        Samples in the collapsed format flamegraph.pl and speedscope read
+
+        Returns:
+            str: one "frame;frame;frame count" line per distinct stack
+        """
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """
+    Profiles requests that send an allowlisted token in a header, plus a random sample of all requests
+
+    Args:
+        output_dir (str): where profile files are written
+        tokens (list): header values that turn profiling on for a request
+        header (str): name of the header carrying the token
+        sample_rate (float): fraction of all requests profiled without a token
+        interval (float): seconds between stack samples
+        keep (int): profiled requests kept on disk before the oldest are deleted
+        use_cprofile (bool): also record deterministic cProfile stats
+        trace_allocations (bool): also record tracemalloc allocation snapshots
+    """
+    def __init__(self, output_dir, tokens=(), header='X-Profile', sample_rate=0.0, interval=0.005, keep=50, use_cprofile=True, trace_allocations=True):
+        self.output_dir = output_dir
+        self.tokens = [token for token in tokens if token]
+        self.header = header
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        self.use_cprofile = use_cprofile
+        self.trace_allocations = trace_allocations
+        self._lock = threading.Lock()
+        # tracemalloc is process wide, so it is started by the first profiled request that needs it
+        # and stopped when the last one finishes
+        self._tracing_requests = 0
+        self._started_tracing = False
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a profiler from profile_* settings in the environment
+        """
+        default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+        return cls(
+            output_dir=os.getenv('profile_dir', default_dir),
+            tokens=os.getenv('profile_tokens', '').split(','),
+            header=os.getenv('profile_header', 'X-Profile'),
+            sample_rate=float(os.getenv('profile_sample_rate', '0')),
+            interval=float(os.getenv('profile_interval_ms', '5')) / 1000,
+            keep=int(os.getenv('profile_keep', '50')),
+            use_cprofile=os.getenv('profile_cprofile', 'true').lower() == 'true',
+            trace_allocations=os.getenv('profile_tracemalloc', 'true').lower() == 'true'
+        )
+
+    @property
+    def enabled(self):
+        """
+        Whether any request could be profiled at all
+        """
+        return bool(self.tokens) or self.sample_rate > 0
+
+    def init_app(self, app):
+        """
+        Hooks the profiler into a Flask app. Does nothing when profiling is off,
+        so requests pay nothing for it.
+        """
+        if not self.enabled:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        app.before_request(self.start)
+        app.teardown_request(self.stop)
+
+    def wanted(self):
+        """
+        Whether the current request should be profiled
+        """
+        token = request.headers.get(self.header)
+        # Compared as bytes, since compare_digest refuses str with non-ASCII characters
+        if token is not None and any(hmac.compare_digest(token.encode(), allowed.encode()) for allowed in self.tokens):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _begin_tracing(self):
+        """
+        Counts a request that needs allocation tracing, starting tracemalloc if it is off
+        """
+        with self._lock:
+            if self._tracing_requests == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                self._started_tracing = True
+            self._tracing_requests += 1
+
+    def _end_tracing(self):
+        """
+        Drops a request from the tracing count, stopping tracemalloc after the last one if we started it
+        """
+        with self._lock:
+            self._tracing_requests -= 1
+            if self._tracing_requests == 0 and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    def start(self):
+        """
+        Starts profiling the current request if it asked for it or was sampled
+        A profiler that fails to start is logged and the request goes on unprofiled.
+        """
+        profile = None
+        try:
+            if not self.wanted():
+                return
+            profile = {'start': time.perf_counter(), 'sampler': StackSampler(threading.get_ident(), self.interval)}
+            if self.trace_allocations:
+                self._begin_tracing()
+                profile['tracing'] = True
+                profile['allocations_before'] = tracemalloc.take_snapshot()
+            if self.use_cprofile:
+                profile['cprofile'] = cProfile.Profile()
+                try:
+                    profile['cprofile'].enable()
+                except ValueError:
+                    # Another profiler is already active on this thread
+                    profile['cprofile'] = None
+            profile['sampler'].start()
+            profile['sampling'] = True
+        except Exception as e:
+            logger.warning("could not start profiling error=%s", e)
+            if profile is not None:
+                self._release(profile)
+            return
+        g.request_profile = profile
+
+    def _release(self, profile):
+        """
+        Stops everything a profile started. Safe to call more than once.
+        """
+        try:
+            if profile.pop('sampling', False):
+                profile['sampler'].stop()
+            if profile.get('cprofile') is not None:
+                profile['cprofile'].disable()
+        finally:
+            if profile.pop('tracing', False):
+                self._end_tracing()
+
+    def stop(self, error=None):
+        """
+        Stops profiling the current request and writes its files
+        Failures are logged rather than raised, so profiling can never break a request.
+        """
+        profile = g.pop('request_profile', None)
+        if profile is None:
+            return
+        try:
+            allocations_after = tracemalloc.take_snapshot() if profile.get('tracing') else None
+            self._release(profile)
+            self._write(profile, allocations_after)
+        except Exception as e:
+            logger.warning("could not profile request error=%s", e)
+        finally:
+            self._release(profile)
+
+    def _write(self, profile, allocations_after):
+        """
+        Writes the files of a finished profile
+        """
+        elapsed = time.perf_counter() - profile['start']
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        slug = ''.join(character if character.isalnum() else '_' for character in route).strip('_') or 'root'
+        now = time.time()
+        stamp = f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(now))}{int(now % 1 * 1000):03d}"
+        base = os.path.join(self.output_dir, f"{stamp}-{request.method}-{slug}-{threading.get_ident()}")
+        try:
+            with open(base + '.collapsed', 'w', encoding="utf-8") as file:
+                file.write(profile['sampler'].collapsed())
+            if profile.get('cprofile') is not None:
+                profile['cprofile'].dump_stats(base + '.prof')
+            if allocations_after is not None:
+                self._write_allocations(base + '.alloc.txt', profile['allocations_before'], allocations_after)
+        except OSError as e:
+            logger.warning("could not write profile path=%s error=%s", base, e)
+            return
+        logger.info("profiled request route=%s method=%s duration_ms=%.1f path=%s", route, request.method, elapsed * 1000, base)
+        self._prune()
+
+    def _write_allocations(self, path, before, after):
+        """
+        Writes the lines that allocated the most memory during the request
+        """
+        differences = after.compare_to(before, 'lineno')
+        with open(path, 'w', encoding="utf-8") as file:
+            for difference in differences[:50]:
+                file.write(f"{difference}\n")
+
+    def _prune(self):
+        """
+        Deletes the oldest profiled requests beyond the retention limit
+        """
+        with self._lock:
+            try:
+                names = os.listdir(self.output_dir)
+            except OSError:
+                return
+            bases = sorted({name.split('.', 1)[0] for name in names if name.endswith(('.collapsed', '.prof', '.alloc.txt'))})
+            for base in bases[:max(0, len(bases) - self.keep)]:
+                for suffix in ('.collapsed', '.prof', '.alloc.txt'):
+                    try:
+                        os.remove(os.path.join(self.output_dir, base + suffix))
+                    except FileNotFoundError:
+                        pass
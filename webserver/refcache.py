@@ -0,0 +1,103 @@
+"""
+Contains an in-process cache for the static reference tables (Race, Class, Background)
+"""
+import threading
+import time
+
+
+class ReferenceTable:
+    """
+    Rows of one reference table indexed by ID and by name
+    Rows keep the (Name, Page_Number, ID) shape of SELECT * on the table
+    """
+    __slots__ = ('rows', 'by_id', 'by_name')
+
+    def __init__(self, rows):
+        self.rows = tuple(tuple(row) for row in rows)
+        self.by_id = {row[2]: row for row in self.rows}
+        self.by_name = {row[0]: row for row in self.rows}
+
+    def name(self, row_id):
+        """
+        Gets the name for an ID, or None if there is no such row
+        """
+        if row_id is None:
+            return None
+        row = self.by_id.get(int(row_id))
+        return row[0] if row else None
+
+
+class ReferenceCache:
+    """
+    Holds every reference table in memory
+
+    Args:
+        load (callable): Returns a dict of table name to list of rows
+        get_version (callable): Returns the current reference data version, or None if unknown
+        check_interval (float): Seconds between version checks against the database
+    """
+    def __init__(self, load, get_version, check_interval=60.0):
+        self._load = load
+        self._get_version = get_version
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._tables = None
+        self._version = None
+        self._checked_at = 0.0
+        self._generation = 0
+
+    def _refresh_if_stale(self):
+        """
+        Loads the tables if they are missing or the version in the database moved on
+
+        Returns:
+            Tuple (tables, version) as of this call
+        """
+        tables, version = self._tables, self._version
+        if tables is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return tables, version
+        with self._lock:
+            if self._tables is None or time.monotonic() - self._checked_at >= self.check_interval:
+                version = self._get_version()
+                if self._tables is None or version != self._version:
+                    self._tables = {name: ReferenceTable(rows) for name, rows in self._load().items()}
+                    self._version = version
+                    self._generation += 1
+                self._checked_at = time.monotonic()
+            return self._tables, self._version
+
+    def table(self, table_name):
+        """
+        Gets one reference table
+
+        Returns:
+            ReferenceTable: rows of the table, or None if it isn't a reference table
+        """
+        tables, _ = self._refresh_if_stale()
+        return tables.get(table_name)
+
+    @property
+    def version(self):
+        """
+        Version of the data currently held
+        """
+        _, version = self._refresh_if_stale()
+        return version
+
+    @property
+    def generation(self):
+        """
+        Number that goes up every time the tables are reloaded
+        Anything derived from the tables can be keyed by it
+        """
+        self._refresh_if_stale()
+        return self._generation
+
+    def invalidate(self):
+        """
+        Drops everything so the next lookup reloads from the database
+        """
+        with self._lock:
+            self._tables = None
+            self._version = None
+            self._checked_at = 0.0
@@ -0,0 +1,79 @@
+"""
+Contains the skills and saving throws rules loaded once from data/skills-and-saving-throws.json
+"""
+import os
+import json
+import threading
+from types import MappingProxyType
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'skills-and-saving-throws.json')
+
+
+class Rules:
+    """
+    Precomputed, read-only view of the rules JSON
+
+    Attributes:
+        abilities (tuple): ability names in sheet order, also the saving throw names
+        saving_throws (tuple): same as abilities
+        skills (mapping): skill name to the ability it uses, in sheet order
+        skills_by_ability (mapping): ability name to a tuple of its skills
+        ability_index (mapping): ability name to its position in abilities
+        skill_index (mapping): skill name to its position in skills
+    """
+    __slots__ = ('abilities', 'saving_throws', 'skills', 'skills_by_ability', 'ability_index', 'skill_index')
+
+    def __init__(self, loaded_json):
+        self.abilities = tuple(loaded_json['Saving throws'])
+        self.saving_throws = self.abilities
+        self.skills = MappingProxyType(dict(loaded_json['Skills']))
+        self.ability_index = MappingProxyType({ability: index for index, ability in enumerate(self.abilities)})
+        self.skill_index = MappingProxyType({skill: index for index, skill in enumerate(self.skills)})
+        by_ability = {ability: [] for ability in self.abilities}
+        for skill, ability in self.skills.items():
+            by_ability[ability].append(skill)
+        self.skills_by_ability = MappingProxyType({ability: tuple(skills) for ability, skills in by_ability.items()})
+
+
+def load_rules(path=RULES_PATH):
+    """
+    Reads and precomputes the rules JSON
+
+    Returns:
+        Rules: immutable rules table
+    """
+    with open(path, encoding="utf-8") as file:
+        return Rules(json.load(file))
+
+
+_rules = None
+_rules_mtime = None
+_rules_lock = threading.Lock()
+_reload = False
+
+
+def enable_reload(enabled=True):
+    """
+    Re-read the rules JSON whenever the file changes. Meant for development.
+    """
+    global _reload
+    _reload = enabled
+
+
+def get_rules():
+    """
+    Gets the rules table, loading it on first use
+
+    Returns:
+        Rules: immutable rules table
+    """
+    global _rules, _rules_mtime
+    if _rules is not None and not _reload:
+        return _rules
+    mtime = os.path.getmtime(RULES_PATH) if _reload else None
+    if _rules is None or mtime != _rules_mtime:
+        with _rules_lock:
+            if _rules is None or mtime != _rules_mtime:
+                _rules = load_rules()
+                _rules_mtime = mtime
+    return _rules
@@ -1,8 +1,48 @@
 """
 Contains only functions that don't interact with the database
 """
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from bcrypt import hashpw, gensalt, checkpw
 from flask import session
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Work factor for new hashes. Stored hashes with a different cost get rehashed on login
+BCRYPT_ROUNDS = int(os.getenv('bcrypt_rounds', '12'))
+# Threads doing bcrypt work and how many hashes may be running or queued at once
+BCRYPT_WORKERS = int(os.getenv('bcrypt_workers', str(os.cpu_count() or 1)))
+BCRYPT_MAX_PENDING = int(os.getenv('bcrypt_max_pending', str(BCRYPT_WORKERS * 4)))
+# Seconds a request waits for a free slot before giving up
+BCRYPT_QUEUE_TIMEOUT = float(os.getenv('bcrypt_queue_timeout', '5'))
+
+_bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+_bcrypt_slots = threading.BoundedSemaphore(BCRYPT_MAX_PENDING)
+
+class PasswordHashingBusy(Exception):
+    """
+    Raised when too many password hashes are already running or queued
+    """
+
+def _run_bcrypt(function, *args):
+    """
+    Runs a bcrypt call on the worker pool and waits for the result
+    """
+    if not _bcrypt_slots.acquire(timeout=BCRYPT_QUEUE_TIMEOUT):
+        raise PasswordHashingBusy("Too many password checks in progress")
+    try:
+        return _bcrypt_pool.submit(function, *args).result()
+    finally:
+        _bcrypt_slots.release()
+
+def _to_bytes(value):
+    """
+    Encodes str to utf-8, leaves bytes alone
+    """
+    return value.encode('utf-8') if isinstance(value, str) else value
+
 def hash_password(password) -> str:
     """
     Hashes a given password
@@ -10,13 +50,24 @@ def hash_password(password) -> str:
     Returns:
         str: hashed password
     """
-    return hashpw(password.encode('utf-8'), gensalt())
+    return _run_bcrypt(hashpw, password.encode('utf-8'), gensalt(BCRYPT_ROUNDS))
 
 def correct_password(hashed_password, entered_password) -> bool:
     """
     Returns whether the entered password matches the hashed password
     """
-    return checkpw(entered_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return _run_bcrypt(checkpw, entered_password.encode('utf-8'), _to_bytes(hashed_password))
+
+def needs_rehash(hashed_password) -> bool:
+    """
+    Returns whether a stored hash was made with a different work factor than BCRYPT_ROUNDS
+    """
+    # bcrypt hashes look like $2b$12$<salt and hash>
+    parts = _to_bytes(hashed_password).split(b'$')
+    try:
+        return int(parts[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
 
 def user_authenticated():
     """
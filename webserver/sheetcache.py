@@ -0,0 +1,105 @@
+"""
+Contains a bounded LRU cache for rendered character sheets
+"""
+import threading
+from collections import OrderedDict
+
+
+class SheetCache:
+    """
+    Keeps the most recently viewed rendered sheets, keyed by character ID and version
+    Every character has a version that invalidate() bumps, so stale entries are never served
+
+    Versions come from one counter and only the most recently invalidated max_versions are kept.
+    A character without one is at the highest version dropped so far, which is at least as new as
+    any version it had, so a sheet rendered before its last change still can't be stored.
+
+    Args:
+        max_size (int): sheets kept before the least recently used is evicted
+        max_versions (int): character versions kept, 4 * max_size and at least 1024 if None
+    """
+    def __init__(self, max_size=256, max_versions=None):
+        self.max_size = max_size
+        self.max_versions = max_versions if max_versions is not None else max(1024, 4 * max_size)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    def key(self, character_id, generation=0):
+        """
+        Cache key for the current version of a character's sheet
+
+        Args:
+            generation: anything else the sheet depends on, like the reference data generation
+        """
+        with self._lock:
+            return (character_id, self._versions.get(character_id, self._floor), generation)
+
+    def get(self, key):
+        """
+        Gets a rendered sheet
+
+        Returns:
+            str: the html, or None if it isn't cached
+        """
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return html
+
+    def put(self, key, html):
+        """
+        Stores a rendered sheet unless the character changed while it was being rendered
+        """
+        character_id, version, _ = key
+        with self._lock:
+            if self._versions.get(character_id, self._floor) != version:
+                return
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def invalidate(self, character_id):
+        """
+        Bumps a character's version and drops its cached sheets
+        """
+        with self._lock:
+            self._clock += 1
+            self._versions[character_id] = self._clock
+            self._versions.move_to_end(character_id)
+            while len(self._versions) > self.max_versions:
+                _, version = self._versions.popitem(last=False)
+                self._floor = max(self._floor, version)
+            for key in [key for key in self._entries if key[0] == character_id]:
+                del self._entries[key]
+            self._counters['invalidations'] += 1
+
+    def stats(self):
+        """
+        Snapshot of cache counters
+
+        Returns:
+            dict: hits, misses, evictions, invalidations and current size
+        """
+        with self._lock:
+            result = dict(self._counters)
+            result.update({
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'versions': len(self._versions),
+            })
+        return result
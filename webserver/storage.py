@@ -0,0 +1,263 @@
+"""
+Contains the database backends: a MariaDB server, or an embedded SQLite file or throwaway database.
+Queries are written for MariaDB; the SQLite backend translates the few bits of dialect they use.
+"""
+import os
+import re
+import sqlite3
+import shutil
+import weakref
+import tempfile
+import threading
+from functools import lru_cache
+from dotenv import load_dotenv
+
+try:
+    import mariadb
+except ImportError:
+    # Only the MariaDB backend needs the driver
+    mariadb = None
+
+load_dotenv()
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Catch this instead of a driver specific error so code works with either backend
+DatabaseError = (sqlite3.Error,) if mariadb is None else (mariadb.Error, sqlite3.Error)
+# Raised on duplicate keys and other constraint violations
+IntegrityError = (sqlite3.IntegrityError,) if mariadb is None else (mariadb.IntegrityError, sqlite3.IntegrityError)
+
+
+def split_statements(sql):
+    """
+    Splits a SQL script into statements. Statements end with a semicolon at the end of a line.
+    """
+    statements = []
+    current = []
+    for line in sql.splitlines():
+        if line.strip().startswith('--') and not current:
+            continue
+        current.append(line)
+        if line.rstrip().endswith(';'):
+            statements.append('\n'.join(current).strip().rstrip(';'))
+            current = []
+    if ''.join(current).strip():
+        statements.append('\n'.join(current).strip())
+    return statements
+
+
+class MariaDBBackend:
+    """
+    Connects to a MariaDB server using the db* settings from .env
+    """
+    name = 'mariadb'
+
+    def connect(self):
+        """
+        Opens a new connection
+
+        Returns:
+            mariadb.connections.Connection: Object for interacting with the database
+        """
+        if mariadb is None:
+            raise RuntimeError("The mariadb package is needed for dbbackend=mariadb")
+        return mariadb.connect(
+            user=os.getenv('dbuser'),
+            password=os.getenv('dbpassword'),
+            host=os.getenv('dbhost'),
+            port=int(os.getenv('dbport')),
+            database=os.getenv('dbname')
+        )
+
+    def script_statements(self, sql):
+        """
+        Statements of a schema or migration script, ready to execute
+        """
+        return split_statements(sql)
+
+    def describe(self):
+        """
+        Where this backend stores data, for log messages
+        """
+        return f"mariadb host={os.getenv('dbhost')} database={os.getenv('dbname')}"
+
+
+@lru_cache(maxsize=512)
+def translate_query(sql):
+    """
+    Rewrites a MariaDB query as SQLite
+
+    Handles %s placeholders, ON DUPLICATE KEY UPDATE with VALUES() and the JSON aggregate functions
+    """
+    sql = re.sub(r'(?i)\bON DUPLICATE KEY UPDATE\b', 'ON CONFLICT DO UPDATE SET', sql)
+    sql = re.sub(r'(?i)\bVALUES\((\w+)\)', r'excluded.\1', sql)
+    sql = re.sub(r'(?i)\bJSON_ARRAYAGG\(', 'json_group_array(', sql)
+    sql = re.sub(r'(?i)\bJSON_ARRAY\(', 'json_array(', sql)
+    return sql.replace('%s', '?')
+
+
+def translate_schema(statement):
+    """
+    Rewrites one MariaDB schema statement as one or more SQLite statements
+
+    Returns:
+        list: SQLite statements
+    """
+    view = re.match(r'(?is)^\s*CREATE\s+OR\s+REPLACE\s+VIEW\s+(\w+)', statement)
+    if view:
+        statement = re.sub(r'(?is)^\s*CREATE\s+OR\s+REPLACE\s+VIEW', 'CREATE VIEW', statement)
+        return [f"DROP VIEW IF EXISTS {view.group(1)}", translate_query(statement)]
+
+    # SQLite index names belong to the database, not a table
+    statement = re.sub(r'(?is)^(\s*DROP\s+INDEX\s+(?:IF\s+EXISTS\s+)?\w+)\s+ON\s+\w+', r'\1', statement)
+
+    # Only MariaDB can skip adding a column that exists; on SQLite migrate.py is what keeps it from running twice
+    statement = re.sub(r'(?i)\bADD\s+COLUMN\s+IF\s+NOT\s+EXISTS\b', 'ADD COLUMN', statement)
+
+    table = re.match(r'(?is)^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', statement)
+    if not table:
+        return [translate_query(statement)]
+
+    # SERIAL and BIGINT UNSIGNED columns become INTEGER, so a single column primary key is the rowid
+    statement = re.sub(r'(?i)\bSERIAL\b|\bBIGINT\s+UNSIGNED\b', 'INTEGER', statement)
+    # MariaDB compares strings case insensitively by default
+    statement = re.sub(r'(?i)\b(VARCHAR\(\d+\))', r'\1 COLLATE NOCASE', statement)
+    # SQLite has no inline indexes, create them after the table
+    indexes = []
+    lines = []
+    for line in statement.splitlines():
+        index = re.match(r'(?i)^\s*INDEX\s+(\w+)\s*(\([^)]*\))\s*,?\s*$', line)
+        if index:
+            indexes.append(f"CREATE INDEX IF NOT EXISTS {index.group(1)} ON {table.group(1)} {index.group(2)}")
+        else:
+            lines.append(line)
+    statement = re.sub(r',(\s*\)\s*)$', r'\1', '\n'.join(lines))
+    return [translate_query(statement)] + indexes
+
+
+class SQLiteCursor(sqlite3.Cursor):
+    """
+    Cursor that accepts queries written for MariaDB
+    """
+    def execute(self, sql, parameters=()):
+        return super().execute(translate_query(sql), parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return super().executemany(translate_query(sql), seq_of_parameters)
+
+
+class SQLiteConnection(sqlite3.Connection):
+    """
+    Connection that hands out SQLiteCursors and can be health checked like a MariaDB connection
+    """
+    def cursor(self, factory=SQLiteCursor):
+        return super().cursor(factory)
+
+    def ping(self):
+        """
+        Raises if the database can't be read
+        """
+        super().execute("SELECT 1").fetchone()
+
+
+class SQLiteBackend:
+    """
+    Embedded SQLite database in WAL mode, so readers don't block the writer
+
+    Args:
+        path (str): database file, relative to the repository root, or ':memory:' for a throwaway
+            database that is deleted when the process exits
+        busy_timeout (float): seconds to wait for another connection's write lock
+    """
+    name = 'sqlite'
+
+    def __init__(self, path, busy_timeout=5.0):
+        self.busy_timeout = busy_timeout
+        self.memory = path == ':memory:'
+        if self.memory:
+            # A shared-cache in-memory database locks whole tables and fails at once instead of
+            # waiting out busy_timeout, so concurrent requests error. A temporary WAL file behaves
+            # like the file backed database; it goes in /dev/shm where there is one to stay in RAM.
+            directory = tempfile.mkdtemp(prefix='dndguide-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+            self.path = os.path.join(directory, 'dndguide.db')
+            weakref.finalize(self, shutil.rmtree, directory, True)
+        else:
+            self.path = path if os.path.isabs(path) else os.path.join(REPO_PATH, path)
+
+    def connect(self):
+        """
+        Opens a new connection
+
+        Returns:
+            SQLiteConnection: Object for interacting with the database
+        """
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,  # The connection pool passes connections between threads
+            factory=SQLiteConnection
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def script_statements(self, sql):
+        """
+        Statements of a MariaDB schema or migration script, rewritten for SQLite
+        """
+        statements = []
+        for statement in split_statements(sql):
+            statements.extend(translate_schema(statement))
+        return statements
+
+    def describe(self):
+        """
+        Where this backend stores data, for log messages
+        """
+        return f"sqlite throwaway path={self.path}" if self.memory else f"sqlite path={self.path}"
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Gets the backend chosen by dbbackend in .env, mariadb unless set to sqlite
+
+    Returns:
+        MariaDBBackend or SQLiteBackend: backend every connection is opened through
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if os.getenv('dbbackend', 'mariadb').lower() == 'sqlite':
+                    _backend = SQLiteBackend(
+                        os.getenv('sqlite_path', 'dndguide.db'),
+                        busy_timeout=float(os.getenv('sqlite_busy_timeout', '5'))
+                    )
+                else:
+                    _backend = MariaDBBackend()
+    return _backend
+
+
+def set_backend(backend):
+    """
+    Replaces the configured backend, e.g. with an in-memory SQLite one for benchmarks
+    Call it before the first connection is opened.
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def run_script(conn, sql):
+    """
+    Runs a MariaDB schema or migration script on a connection from the current backend
+    """
+    cursor = conn.cursor()
+    for statement in get_backend().script_statements(sql):
+        cursor.execute(statement)
+    conn.commit()
@@ -0,0 +1,138 @@
+"""
+Contains an in-memory throttle for failed login and password reset attempts
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class SlidingWindowCounter:
+    """
+    Counts events per key over the last window seconds
+    Keeps at most max_keys keys, evicting the least recently used
+
+    Args:
+        limit (int): events allowed per key inside the window
+        window (float): length of the window in seconds
+        max_keys (int): keys tracked before the oldest are evicted
+    """
+    def __init__(self, limit, window, max_keys):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._events = OrderedDict()
+        self.evictions = 0
+
+    def _trim(self, key, now):
+        """
+        Drops events for key that fell out of the window
+
+        Returns:
+            deque: remaining timestamps, or None if the key isn't tracked
+        """
+        events = self._events.get(key)
+        if events is None:
+            return None
+        cutoff = now - self.window
+        while events and events[0] <= cutoff:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        self._events.move_to_end(key)
+        return events
+
+    def over_limit(self, key, now):
+        """
+        Whether key already used up its events for the current window
+        """
+        events = self._trim(key, now)
+        return events is not None and len(events) >= self.limit
+
+    def add(self, key, now):
+        """
+        Records one event for key
+        """
+        events = self._trim(key, now)
+        if events is None:
+            events = self._events[key] = deque(maxlen=self.limit)
+            while len(self._events) > self.max_keys:
+                self._events.popitem(last=False)
+                self.evictions += 1
+        events.append(now)
+
+    def reset(self, key):
+        """
+        Forgets every event for key
+        """
+        self._events.pop(key, None)
+
+    def __len__(self):
+        return len(self._events)
+
+
+class LoginThrottle:
+    """
+    Rejects attempts for usernames and client addresses with too many recent failures
+    Checking is cheap so it runs before any database or bcrypt work
+
+    Args:
+        user_limit (int): failures allowed per username inside the window
+        address_limit (int): failures allowed per client address inside the window
+        window (float): seconds failures are remembered for
+        max_keys (int): usernames and addresses tracked before the oldest are evicted
+    """
+    def __init__(self, user_limit=5, address_limit=20, window=300.0, max_keys=10000):
+        self._lock = threading.Lock()
+        self._users = SlidingWindowCounter(user_limit, window, max_keys)
+        self._addresses = SlidingWindowCounter(address_limit, window, max_keys)
+        self._counters = {
+            'allowed': 0,
+            'rejected': 0,
+            'failures': 0,
+        }
+
+    def allowed(self, username, address):
+        """
+        Whether an attempt for username from address may go ahead
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._users.over_limit(username, now) or self._addresses.over_limit(address, now):
+                self._counters['rejected'] += 1
+                return False
+            self._counters['allowed'] += 1
+            return True
+
+    def record_failure(self, username, address):
+        """
+        Counts a failed attempt against both the username and the address
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._users.add(username, now)
+            self._addresses.add(address, now)
+            self._counters['failures'] += 1
+
+    def record_success(self, username):
+        """
+        Clears the failures of a username after it logged in
+        """
+        with self._lock:
+            self._users.reset(username)
+
+    def stats(self):
+        """
+        Snapshot of throttle counters
+
+        Returns:
+            dict: allowed, rejected and failure counts plus tracked keys and evictions
+        """
+        with self._lock:
+            result = dict(self._counters)
+            result.update({
+                'tracked_usernames': len(self._users),
+                'tracked_addresses': len(self._addresses),
+                'evictions': self._users.evictions + self._addresses.evictions,
+            })
+        return result